@@ -1,21 +1,38 @@
 import sys
 import os
+import json
+import asyncio
 import argparse
+import threading
 import warnings
+
+from lib import profiling
+
+# rerun under -X importtime before the imports below are paid for
+if __name__ == "__main__" and profiling.PROFILE_FLAG in sys.argv and not profiling.is_profiling():
+    sys.exit(profiling.run_profiled(sys.argv))
+
 from colorama import init
 from halo import Halo
-from pyfiglet import figlet_format
-from termcolor import cprint
 
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.prebuilt import create_react_agent
-from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 
-from lib.llm import llm
-from lib.tools import get_tools
-from lib.prompt import system_message
+from lib.tools import ANSWER_TTLS, get_tools, opts
+from lib import cache, tracing
+from lib.client import client
+from lib.llm import get_llm
+from lib.pipeline import timer
+from lib.routing import ToolSelector
+from lib.runner import build_agent, run_agent
+from lib.watcher import BlockWatcher
+from lib.constants import (
+    CHECKPOINT_PATH,
+    PREWARM_TOOLS,
+    TOOL_SELECTION_TOP_K,
+    TRACE_PATH,
+)
 from lib.utils import (
-    log_step,
+    StreamRenderer,
     get_random_thread_id,
     log_error,
     set_color,
@@ -33,12 +50,68 @@ def get_args():
         "-a",
         "--address",
         type=str,
-        help="",
+        nargs="+",
+        help="The wallet to ask about. Further addresses are the user's other wallets, which the wallet tools can search too.",
         required=False,
     )
+    parser.add_argument(
+        "--prewarm",
+        nargs="*",
+        default=PREWARM_TOOLS,
+        help="Retrievers to build in the background at startup, 'all' for every one. The rest are built on first use.",
+    )
+    parser.add_argument(
+        "--thread",
+        type=str,
+        help="Resume the conversation with this thread id.",
+    )
+    parser.add_argument(
+        "--no-answer-cache",
+        action="store_true",
+        help="Always run the agent instead of reusing answers to similar earlier questions.",
+    )
+    parser.add_argument(
+        "-q",
+        "--query",
+        action="append",
+        help="Answer this question without the REPL and print the result as JSON. Repeat for several turns of one thread, '-' reads one question per line from stdin.",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Serve POST /chat over HTTP for any address instead of starting the REPL.",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--max-tools",
+        type=int,
+        default=TOOL_SELECTION_TOP_K,
+        help="Bind only this many tools, the ones most relevant to the question, to each model call. 0 binds every tool.",
+    )
+    parser.add_argument(
+        "--trace",
+        nargs="?",
+        const=TRACE_PATH,
+        help=f"Time every LLM call, tool, embedding batch, search and HTTP request of each turn, print a summary after it and append the spans to this JSONL file (default: {TRACE_PATH}).",
+    )
+    parser.add_argument(
+        "--no-watch",
+        action="store_true",
+        help="Don't follow new blocks in the background during a REPL session; the wallet's transactions are then fetched once.",
+    )
+    parser.add_argument(
+        profiling.PROFILE_FLAG,
+        action="store_true",
+        help="Run under -X importtime and report which imports startup spent its time on, then the ones first used later.",
+    )
     args = parser.parse_args()
 
-    address = args.address or os.getenv("ACCOUNT_ADDRESS")
+    address = args.address[0] if args.address else os.getenv("ACCOUNT_ADDRESS")
+
+    if args.serve and address is None:
+        # every request names its own address
+        return args
 
     if address is None:
         parser.error(
@@ -48,42 +121,42 @@ def get_args():
     # if address.endswith(".eth"):
     #     address = ens_name_resolver(address)
 
-    if not is_address(address):
+    args.wallets = args.address or [address]
+    if not all(is_address(wallet) for wallet in args.wallets):
         parser.error("Please provide a valid Ethereum account address.")
 
     if args.address:
-        os.environ["ACCOUNT_ADDRESS"] = args.address
+        os.environ["ACCOUNT_ADDRESS"] = address
+
+    return args
 
 
 def setup_cli():
+    from pyfiglet import figlet_format
+    from termcolor import cprint
+
     cprint(
         figlet_format("Crypto Agent", font="starwars", width=100, justify="center"),
         attrs=["bold"],
     )
     print("A Crypto AI assistant powered by LangGraph and LangChain.")
-    print("Type 'exit' to quit.\n")
+    print("Type 'exit' to quit, 'timings' for index build times, 'http' for API usage, 'cache' for cache hits, 'tools' for tool selection, 'watch' for new blocks.\n")
     print(f"Account Address: {set_color(os.getenv('ACCOUNT_ADDRESS'), 'yellow')}\n")
 
 
-if __name__ == "__main__":
-    get_args()
-    setup_cli()
-
-    checkpointer = MemorySaver()
-    tools = get_tools()
-
-    print("\nAvailable Tools:")
-    for tool in tools:
-        print(f"- {set_color(tool.name, 'purple')}: {tool.description}")
-
-    langgraph_agent_executor = create_react_agent(
-        model=llm, tools=tools, checkpointer=checkpointer, state_modifier=system_message
-    )
-
-    thread_id = get_random_thread_id()
-
+async def run_repl(
+    langgraph_agent_executor,
+    thread_id,
+    answers=None,
+    wallets=None,
+    selector=None,
+    watcher=None,
+):
+    spinner = Halo(text="Thinking...", spinner="dots")
+    renderer = StreamRenderer(spinner)
     while True:
         try:
+            # nothing else runs on the loop while waiting for the user
             user_input = input("\nUser: ")
             if user_input.lower() in ["exit", "quit", "q"]:
                 print("Exiting...")
@@ -92,18 +165,148 @@ if __name__ == "__main__":
             if not user_input.strip():
                 continue
 
+            if user_input.lower() == "timings":
+                timer.report()
+                continue
+
+            if user_input.lower() == "http":
+                client.report()
+                continue
+
+            if user_input.lower() == "cache":
+                cache.report(answers)
+                continue
+
+            if user_input.lower() == "tools":
+                if selector:
+                    selector.report()
+                else:
+                    print("Every tool is bound to every call.")
+                continue
+
+            if user_input.lower() == "watch":
+                if watcher:
+                    watcher.report()
+                else:
+                    print("New blocks aren't being followed.")
+                continue
+
             spinner = Halo(text="Thinking...", spinner="dots")
-            for step in langgraph_agent_executor.stream(
-                {"messages": [HumanMessage(content=user_input)]},
-                config={"configurable": {"thread_id": thread_id}},
-            ):
-                spinner.start()
-                log_step(step, spinner)
+            spinner.start()
+            renderer = StreamRenderer(spinner)
+            await run_agent(
+                langgraph_agent_executor,
+                user_input,
+                os.getenv("ACCOUNT_ADDRESS"),
+                thread_id,
+                answers=answers,
+                renderer=renderer,
+                wallets=wallets,
+            )
+            spinner.stop()
 
         except KeyboardInterrupt:
+            renderer.close()
             print("\nExiting...")
             break
         except Exception as e:
+            renderer.close()
             spinner.stop()
             log_error(e)
             break
+
+
+def get_queries(args):
+    for query in args.query:
+        if query == "-":
+            yield from (line.strip() for line in sys.stdin if line.strip())
+        else:
+            yield query
+
+
+async def run_queries(langgraph_agent_executor, args, thread_id, answers=None):
+    """Answer each query in turn on one thread, printing one JSON line per answer."""
+    address = os.getenv("ACCOUNT_ADDRESS")
+    for query in get_queries(args):
+        try:
+            result = await run_agent(
+                langgraph_agent_executor,
+                query,
+                address,
+                thread_id,
+                answers=answers,
+                wallets=args.wallets,
+            )
+        except Exception as e:
+            result = {"error": str(e)}
+        print(
+            json.dumps(
+                {"thread_id": thread_id, "address": address, "query": query, **result}
+            ),
+            flush=True,
+        )
+
+
+async def main(args, tools):
+    # conversations survive restarts and can be resumed with --thread
+    async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_PATH) as checkpointer:
+        selector = None
+        if args.max_tools and len(tools) > args.max_tools:
+            selector = ToolSelector(tools, args.max_tools)
+        langgraph_agent_executor = build_agent(tools, checkpointer, selector=selector)
+        answers = None if args.no_answer_cache else cache.SemanticCache(ANSWER_TTLS)
+
+        profiling.mark_ready()
+        if args.serve:
+            from lib.server import serve
+
+            await serve(langgraph_agent_executor, args.host, args.port, answers)
+            return
+
+        thread_id = args.thread or str(get_random_thread_id())
+        if args.query:
+            await run_queries(langgraph_agent_executor, args, thread_id, answers)
+            return
+
+        print(f"\nThread: {set_color(thread_id, 'yellow')} (resume with --thread {thread_id})")
+        # build the chat model while the first question is typed
+        threading.Thread(target=get_llm, daemon=True).start()
+        watcher = None
+        if not args.no_watch:
+            # keeps the wallets' stores current on its own thread, never awaited
+            watcher = BlockWatcher(args.wallets, opts)
+            watcher.start()
+        try:
+            await run_repl(
+                langgraph_agent_executor,
+                thread_id,
+                answers,
+                args.wallets,
+                selector,
+                watcher,
+            )
+        finally:
+            if watcher:
+                watcher.stop()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    interactive = not (args.query or args.serve)
+    if interactive:
+        setup_cli()
+
+    if args.trace:
+        tracing.configure(args.trace)
+
+    tools = get_tools(prewarm_tools=args.prewarm, require_address=not args.serve)
+
+    if interactive:
+        print("\nAvailable Tools:")
+        for tool in tools:
+            print(f"- {set_color(tool.name, 'purple')}: {tool.description}")
+
+    try:
+        asyncio.run(main(args, tools))
+    except KeyboardInterrupt:
+        print("\nExiting...")
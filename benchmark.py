@@ -0,0 +1,520 @@
+"""
+End-to-end benchmarks run offline against recorded API fixtures.
+
+Etherscan, CoinGecko and OpenSea are answered from bench/fixtures by a stand-in
+transport mounted on the shared HTTP client. The Etherscan transaction list is
+the recorded row repeated with varying hashes, blocks and counterparties, so the
+wallet can be any size. Documents are embedded with the local hashing embedder
+and the agent is driven by a scripted chat model, so the numbers measure this
+code rather than the network or a model.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --compare bench.json
+
+Each stage runs in a fresh process and working directory. Results are written
+as JSON; --compare prints the change against an earlier run and exits non-zero
+when a timing got slower by more than --threshold.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import shutil
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+START = time.perf_counter()
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(ROOT, "bench", "fixtures")
+
+SCHEMA_VERSION = 1
+NOISE_MS = 1.0
+ADDRESS = "0x9aa99c23f67c81701c772b106b4f83f6e858dd2e"
+TXS_PER_BLOCK = 4
+COUNTERPARTIES = 50
+FUNCTIONS = [
+    "transfer(address _to, uint256 _value)",
+    "approve(address spender, uint256 amount)",
+    "swapExactETHForTokens(uint256 amountOutMin, address[] path, address to, uint256 deadline)",
+    "",
+]
+SEMANTIC_QUERIES = [
+    "large ETH transfers I received",
+    "token approvals I granted",
+    "swaps on a decentralized exchange",
+    "failed transactions that cost me gas",
+    "payments I sent last year",
+]
+
+ENV = {
+    "EMBEDDING_BACKEND": "local",
+    "ETHERSCAN_API_KEY": "bench",
+    "OPENSEA_API_KEY": "bench",
+    "ACCOUNT_ADDRESS": ADDRESS,
+}
+
+
+def get_hash(kind, i):
+    return "0x" + hashlib.blake2b(f"{kind}:{i}".encode(), digest_size=32).hexdigest()
+
+
+def get_counterparty(i):
+    return "0x" + hashlib.blake2b(f"counterparty:{i}".encode(), digest_size=20).hexdigest()
+
+
+class Replay:
+    """Answers API requests from the fixture files, one file per host."""
+
+    def __init__(self, size, directory=FIXTURES_DIR):
+        self.size = size
+        self.fixtures = {}
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                with open(os.path.join(directory, name)) as f:
+                    self.fixtures[name[: -len(".json")]] = json.load(f)
+
+    def find(self, host, path, params):
+        for fixture in self.fixtures.get(host, []):
+            if "path" in fixture and fixture["path"] != path:
+                continue
+            if not path.startswith(fixture.get("path_prefix", "")):
+                continue
+            if all(params.get(k) == v for k, v in fixture["params"].items()):
+                return fixture
+        return None
+
+    def respond(self, host, path, params):
+        fixture = self.find(host, path, params)
+        if fixture is None:
+            if host == "api.etherscan.io":
+                # what Etherscan answers for an address without such rows
+                return 200, {"status": "0", "message": "No transactions found", "result": []}
+            return 404, {"errors": [f"no fixture for {host}{path}"]}
+        if "rows" in fixture:
+            return 200, {"status": "1", "message": "OK", "result": self.get_rows(fixture["rows"], params)}
+        return 200, fixture["body"]
+
+    def get_rows(self, template, params):
+        """One page of the synthetic history, `TXS_PER_BLOCK` rows per block."""
+        base_block = int(template["blockNumber"])
+        start = max(0, (int(params["startblock"]) - base_block) * TXS_PER_BLOCK)
+        end = min(self.size, (int(params["endblock"]) - base_block + 1) * TXS_PER_BLOCK)
+        offset = int(params["offset"])
+        first = start + (int(params["page"]) - 1) * offset
+        return [
+            self.get_row(template, i, params["address"])
+            for i in range(first, min(end, first + offset))
+        ]
+
+    def get_row(self, template, i, address):
+        block = int(template["blockNumber"]) + i // TXS_PER_BLOCK
+        counterparty = get_counterparty(i % COUNTERPARTIES)
+        sender, receiver = (address, counterparty) if i % 2 else (counterparty, address)
+        function = FUNCTIONS[i % len(FUNCTIONS)]
+        return {
+            **template,
+            "blockNumber": str(block),
+            "timeStamp": str(int(template["timeStamp"]) + (i // TXS_PER_BLOCK) * 12),
+            "hash": get_hash("tx", i),
+            "blockHash": get_hash("block", block),
+            "nonce": str(i // 2),
+            "transactionIndex": str(i % TXS_PER_BLOCK),
+            "from": sender.lower(),
+            "to": receiver.lower(),
+            "value": str((i * 7919 % 10_000) * 10**15),
+            "gasPrice": str(int(template["gasPrice"]) + i % 997 * 10**7),
+            "isError": "1" if i % 37 == 0 else "0",
+            "functionName": function,
+            "methodId": template["methodId"] if function else "0x",
+        }
+
+
+class ReplayAdapter(HTTPAdapter):
+    def __init__(self, replay):
+        super().__init__()
+        self.replay = replay
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        status, body = self.replay.respond(url.hostname, url.path, dict(parse_qsl(url.query)))
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(body).encode("utf-8")
+        response.headers["Content-Type"] = "application/json"
+        response.url = request.url
+        response.request = request
+        return response
+
+
+def install_replay(size):
+    from lib.client import client
+
+    replay = Replay(size)
+
+    def handle(request):
+        status, body = replay.respond(
+            request.url.host, request.url.path, dict(request.url.params)
+        )
+        return httpx.Response(status, json=body)
+
+    adapter = ReplayAdapter(replay)
+    client.mount("https://", adapter)
+    client.mount("http://", adapter)
+    client.async_transport = httpx.MockTransport(handle)
+    # rate limits would only measure the sleeps
+    client.buckets = {}
+
+
+def get_scripted_model():
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    class ScriptedChatModel(BaseChatModel):
+        """Searches the wallet for the user's question, then answers with the result."""
+
+        @property
+        def _llm_type(self):
+            return "scripted"
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            last = messages[-1]
+            if isinstance(last, HumanMessage):
+                message = AIMessage(
+                    content="",
+                    tool_calls=[
+                        {
+                            "name": "retrieve_wallet_docs",
+                            "args": {"query": last.content},
+                            "id": f"call_{len(messages)}",
+                        }
+                    ],
+                )
+            else:
+                message = AIMessage(content=f"Here is what I found: {str(last.content)[:300]}")
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    return ScriptedChatModel()
+
+
+def summarize(samples):
+    ms = sorted(sample * 1000 for sample in samples)
+    return {
+        "p50_ms": round(statistics.median(ms), 2),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 2),
+        "mean_ms": round(statistics.fmean(ms), 2),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def get_queries(size, repeat):
+    """(kind, query, filters) triples touching rows spread over the history."""
+    queries = []
+    for r in range(repeat):
+        i = (r * 7_919) % size
+        block = 14923678 + i // TXS_PER_BLOCK
+        queries += [
+            ("exact_hash", f"details of {get_hash('tx', i)}", {}),
+            ("exact_block", f"what happened in block {block}", {}),
+            ("semantic", SEMANTIC_QUERIES[r % len(SEMANTIC_QUERIES)], {}),
+            (
+                "filtered",
+                SEMANTIC_QUERIES[r % len(SEMANTIC_QUERIES)],
+                {"counterparty": get_counterparty(r % COUNTERPARTIES), "start_block": block},
+            ),
+        ]
+    return queries
+
+
+def run_startup(args):
+    install_replay(args.size)
+    from lib.constants import PREWARM_TOOLS
+    from lib.pipeline import get_wallet_index
+    from lib.tools import get_tools, opts
+
+    imported = time.perf_counter() - START
+    tools, get_tools_s = timed(get_tools, search_tools=False)
+    wallet_index = get_wallet_index(ADDRESS, opts)
+    _, ready_s = timed(wallet_index.ensure, PREWARM_TOOLS)
+    _, query_s = timed(wallet_index.search, SEMANTIC_QUERIES[0])
+    return {
+        "import_s": round(imported, 3),
+        "get_tools_ms": round(get_tools_s * 1000, 2),
+        "ready_s": round(ready_s, 3),
+        "first_query_ms": round(query_s * 1000, 2),
+        "tools": len(tools),
+    }
+
+
+def run_retrieval(args):
+    install_replay(args.size)
+    from lib.pipeline import get_wallet_index
+    from lib.tools import opts
+
+    wallet_index = get_wallet_index(ADDRESS, opts)
+    _, index_s = timed(wallet_index.ensure)
+    # the first search loads the embedder's query path and Chroma's segments
+    wallet_index.search(SEMANTIC_QUERIES[0])
+
+    samples = {}
+    for kind, query, filters in get_queries(args.size, args.repeat):
+        _, seconds = timed(wallet_index.search, query, **filters)
+        samples.setdefault(kind, []).append(seconds)
+    return {
+        "index_s": round(index_s, 3),
+        "rows_per_s": round(args.size / index_s),
+        "lexical_mb": round(wallet_index.lexical.memory / 1024**2, 1),
+        # the vector store estimate counted against WALLET_MEMORY_BUDGET
+        "vector_mb": round(wallet_index.vector_memory / 1024**2, 1),
+        **{kind: summarize(seconds) for kind, seconds in samples.items()},
+    }
+
+
+async def run_turns(args):
+    install_replay(args.size)
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    from lib.cache import SemanticCache
+    from lib.constants import CHECKPOINT_PATH
+    from lib.routing import ToolSelector
+    from lib.runner import build_agent, run_agent
+    from lib.tools import ANSWER_TTLS, get_tools
+
+    tools = get_tools(search_tools=False)
+    queries = get_queries(args.size, args.repeat)
+    async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_PATH) as checkpointer:
+        # routed like agent.py, so the selection overhead is part of the turn
+        selector = ToolSelector(tools)
+        executor = build_agent(
+            tools, checkpointer, model=get_scripted_model(), selector=selector
+        )
+
+        # the first turn indexes the wallet
+        start = time.perf_counter()
+        await run_agent(executor, SEMANTIC_QUERIES[0], ADDRESS, "bench-first")
+        first_s = time.perf_counter() - start
+
+        turns = []
+        for i, (_, query, _) in enumerate(queries):
+            start = time.perf_counter()
+            await run_agent(executor, query, ADDRESS, f"bench-{i}")
+            turns.append(time.perf_counter() - start)
+
+        answers = SemanticCache(ANSWER_TTLS)
+        await run_agent(executor, SEMANTIC_QUERIES[1], ADDRESS, "bench-cached", answers)
+        cached = []
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            result = await run_agent(
+                executor, SEMANTIC_QUERIES[1], ADDRESS, f"bench-cached-{i}", answers
+            )
+            cached.append(time.perf_counter() - start)
+            assert result["cached"], "the repeated question should be answered from the cache"
+
+    return {
+        "tool_select_ms": round(selector.seconds / max(selector.calls, 1) * 1000, 2),
+        "first_turn_s": round(first_s, 3),
+        "turn": summarize(turns),
+        "cached_turn": summarize(cached),
+    }
+
+
+STAGES = {
+    "startup": run_startup,
+    "retrieval": run_retrieval,
+    "turn": lambda args: asyncio.run(run_turns(args)),
+}
+
+
+def run_stage(stage, workdir, size, repeat):
+    """Run `stage` in a fresh process inside `workdir`, returning its result."""
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--stage",
+        stage,
+        "--size",
+        str(size),
+        "--repeat",
+        str(repeat),
+    ]
+    start = time.perf_counter()
+    process = subprocess.run(
+        command,
+        cwd=workdir,
+        env={**os.environ, **ENV},
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    wall_s = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{stage} benchmark (size {size}) failed")
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    return {"wall_s": round(wall_s, 3), **result}
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_all(args):
+    from lib.utils import console
+
+    results = {"startup": {}, "retrieval": {}}
+    workdirs = []
+
+    def make_workdir():
+        workdirs.append(tempfile.mkdtemp(prefix="bench-"))
+        return workdirs[-1]
+
+    try:
+        # cold starts with nothing on disk, warm reuses what cold left behind
+        workdir = make_workdir()
+        for name in ["cold", "warm"]:
+            console.print(f"startup ({name}, {args.startup_size} transactions)")
+            results["startup"][name] = run_stage(
+                "startup", workdir, args.startup_size, args.repeat
+            )
+        for size in args.sizes:
+            console.print(f"retrieval ({size} transactions)")
+            results["retrieval"][str(size)] = run_stage(
+                "retrieval", make_workdir(), size, args.repeat
+            )
+        console.print(f"agent turns ({args.turn_size} transactions)")
+        results["turn"] = run_stage("turn", make_workdir(), args.turn_size, args.repeat)
+    finally:
+        if not args.keep:
+            for workdir in workdirs:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "schema": SCHEMA_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {
+            "sizes": args.sizes,
+            "startup_size": args.startup_size,
+            "turn_size": args.turn_size,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(baseline, current, threshold):
+    """Print each metric against the baseline, returning the timings that regressed."""
+    from rich.table import Table
+
+    from lib.utils import console
+
+    if baseline.get("schema") != current.get("schema"):
+        console.print("[yellow]Baseline was written by another schema version.[/yellow]")
+    before = flatten(baseline["results"])
+    after = flatten(current["results"])
+
+    table = Table(title=f"Benchmark vs {baseline.get('commit') or 'baseline'}")
+    table.add_column("Metric")
+    for column in ["Before", "After", "Change"]:
+        table.add_column(column, justify="right")
+
+    regressions = []
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        change = (new - old) / old if old else 0.0
+        style = ""
+        # timings are better lower, everything else is informational
+        if key.endswith(("_s", "_ms")):
+            delta_ms = (new - old) * (1000 if key.endswith("_s") else 1)
+            # sub-millisecond jitter isn't a regression however large in percent
+            if change > threshold and delta_ms > NOISE_MS:
+                style = "red"
+                regressions.append(key)
+            elif change < -threshold and -delta_ms > NOISE_MS:
+                style = "green"
+        table.add_row(key, f"{old:g}", f"{new:g}", f"{change:+.1%}", style=style)
+    console.print(table)
+    return regressions
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Benchmark the agent offline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="wallet sizes, in transactions, to measure retrieval at")
+    parser.add_argument("--startup-size", type=int, default=10_000,
+                        help="wallet size for the cold and warm startup runs")
+    parser.add_argument("--turn-size", type=int, default=1_000,
+                        help="wallet size for the agent turn runs")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="samples per measured query or turn")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="a results file from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown counted as a regression by --compare")
+    parser.add_argument("--keep", action="store_true", help="keep the working directories")
+    parser.add_argument("--stage", choices=list(STAGES), help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    if args.stage:
+        os.environ.update(ENV)
+        print(json.dumps(STAGES[args.stage](args)))
+        sys.exit(0)
+
+    os.environ.update(ENV)
+    current = run_all(args)
+    output = json.dumps(current, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, current, args.threshold):
+            sys.exit(1)
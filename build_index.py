@@ -0,0 +1,48 @@
+"""
+Build the knowledge base index artifact the whitepaper retriever loads.
+
+The whitepaper and every .pdf, .md and .txt file under knowledge/ are chunked
+and embedded into knowledge_index/: a manifest, the chunks and a float32 vector
+file that is memory-mapped at startup. Only new or changed documents are
+embedded; ship the directory to skip the build on other machines.
+
+    python build_index.py
+    python build_index.py --refresh
+"""
+
+import argparse
+
+from rich.table import Table
+
+from lib.knowledge import build_index, get_sources, open_index
+from lib.utils import console
+from lib.constants import KNOWLEDGE_INDEX_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the knowledge base index.")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="refetch the whitepaper and other URLs, rebuilding them if they changed",
+    )
+    args = parser.parse_args()
+
+    statuses = build_index(get_sources(), refresh=args.refresh)
+    index = open_index(KNOWLEDGE_INDEX_DIR)
+
+    table = Table(title=f"Knowledge index v{index.manifest['version'] if index else '-'}")
+    table.add_column("Source")
+    table.add_column("Status")
+    for source, status in statuses.items():
+        table.add_row(source, status)
+    console.print(table)
+    if index:
+        console.print(
+            f"{index.manifest['rows']} chunks of {index.manifest['dim']} dimensions "
+            f"embedded with {index.manifest['embedding_model']} in {KNOWLEDGE_INDEX_DIR}/"
+        )
+
+
+if __name__ == "__main__":
+    main()
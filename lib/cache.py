@@ -0,0 +1,363 @@
+import re
+import json
+import time
+import inspect
+import sqlite3
+import threading
+import functools
+from collections import OrderedDict
+
+import numpy as np
+from rich.table import Table
+
+from lib import tracing
+from lib.utils import console
+from lib.llm import embedding_model, get_embeddings
+from lib.hybrid import HEX_RE, get_query_identifiers
+from lib.txstore import get_version
+from lib.constants import (
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_SIZE,
+    SEMANTIC_CACHE_SIZE,
+    SEMANTIC_CACHE_THRESHOLD,
+)
+
+caches = {}
+
+NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+class TTLCache:
+    """
+    LRU cache whose entries expire after a per-entry TTL (None keeps them
+    forever). With `path` set, entries are also written to a SQLite file so
+    they survive restarts; the file is pruned to `maxsize` live rows on open.
+    """
+
+    def __init__(
+        self, name, maxsize=RESPONSE_CACHE_SIZE, path=RESPONSE_CACHE_PATH
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = None
+        if path:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (name TEXT, key TEXT, "
+                "expires REAL, value TEXT, PRIMARY KEY (name, key))"
+            )
+            with self.connection:
+                self.connection.execute(
+                    "DELETE FROM responses WHERE expires < ?", (time.time(),)
+                )
+                self.connection.execute(
+                    "DELETE FROM responses WHERE name = ? AND key NOT IN "
+                    "(SELECT key FROM responses WHERE name = ? "
+                    "ORDER BY rowid DESC LIMIT ?)",
+                    (name, name, maxsize),
+                )
+
+        caches[name] = self
+
+    def get(self, key):
+        """Returns (found, value)."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and self.connection is not None:
+                row = self.connection.execute(
+                    "SELECT expires, value FROM responses WHERE name = ? AND key = ?",
+                    (self.name, key),
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], json.loads(row[1]))
+                    self.entries[key] = entry
+                    if len(self.entries) > self.maxsize:
+                        self.entries.popitem(last=False)
+
+            if entry is not None and (entry[0] is None or entry[0] > time.time()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+
+            if entry is not None:
+                self.entries.pop(key, None)
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value, ttl):
+        expires = None if ttl is None else time.time() + ttl
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+            if self.connection is not None:
+                try:
+                    data = json.dumps(value)
+                except TypeError:
+                    return
+                with self.connection:
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                        (self.name, key, expires, data),
+                    )
+
+
+def cached(name, ttl, cache_if=None):
+    """
+    Cache a tool's return value per argument set.
+
+    `ttl` is seconds, None for forever, or a callable taking the call's
+    arguments and returning either. `cache_if` can reject values such as
+    error payloads. Tools with the same `name` share one cache.
+    """
+    cache = caches.get(name) or TTLCache(name)
+
+    def decorator(func):
+        def get_key(args, kwargs):
+            return json.dumps(
+                [func.__name__, args, kwargs], sort_keys=True, default=str
+            )
+
+        def lookup(key):
+            with tracing.span(name, "cache") as span:
+                found, value = cache.get(key)
+                span.set(cache_hits=int(found), cache_misses=int(not found))
+            return found, value
+
+        def store(key, value, args, kwargs):
+            if cache_if is None or cache_if(value):
+                cache.set(key, value, ttl(*args, **kwargs) if callable(ttl) else ttl)
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                key = get_key(args, kwargs)
+                found, value = lookup(key)
+                if not found:
+                    value = await func(*args, **kwargs)
+                    store(key, value, args, kwargs)
+                return value
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                key = get_key(args, kwargs)
+                found, value = lookup(key)
+                if not found:
+                    value = func(*args, **kwargs)
+                    store(key, value, args, kwargs)
+                return value
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def get_question_terms(question):
+    """
+    The identifiers and numbers in a question. Questions about another year,
+    amount or hash can embed almost alike, so a hit needs the same ones.
+    """
+    question = question.lower()
+    numbers = NUMBER_RE.findall(HEX_RE.sub(" ", question))
+    return frozenset(get_query_identifiers(question) + numbers)
+
+
+class SemanticCache:
+    """
+    Final agent answers looked up by question similarity. An answer is reused
+    for an address while its stored transaction history is unchanged and the
+    shortest TTL among the tools that produced it holds. `ttls` maps tool names
+    to TTLs; answers that used no tool, an unknown tool or a failed call are not
+    cached, since they tend to depend on the conversation rather than on data.
+    Follow-ups like "and last month?" depend on the question before them, so
+    that question is part of the key and of the text embedded. A similar
+    question only hits if it has the same numbers and identifiers.
+    """
+
+    def __init__(
+        self,
+        ttls,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        maxsize=SEMANTIC_CACHE_SIZE,
+        path=RESPONSE_CACHE_PATH,
+    ):
+        self.ttls = ttls
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.entries = []
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = None
+        if path:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            with self.connection:
+                columns = [
+                    row[1] for row in self.connection.execute("PRAGMA table_info(answers)")
+                ]
+                if columns and "context" not in columns:
+                    # answers cached without their context may be to follow-ups
+                    self.connection.execute("DROP TABLE answers")
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS answers (model TEXT, address TEXT, "
+                    "context TEXT, question TEXT, vector BLOB, answer TEXT, "
+                    "version TEXT, expires REAL)"
+                )
+                self.connection.execute(
+                    "DELETE FROM answers WHERE expires < ?", (time.time(),)
+                )
+                self.connection.execute(
+                    "DELETE FROM answers WHERE rowid NOT IN "
+                    "(SELECT rowid FROM answers ORDER BY rowid DESC LIMIT ?)",
+                    (maxsize,),
+                )
+            rows = self.connection.execute(
+                "SELECT address, context, question, vector, answer, version, expires "
+                "FROM answers WHERE model = ? ORDER BY rowid DESC LIMIT ?",
+                (embedding_model, maxsize),
+            )
+            for address, context, question, vector, answer, version, expires in rows:
+                self.entries.insert(
+                    0,
+                    {
+                        "address": address,
+                        "context": context,
+                        "question": question,
+                        "terms": get_question_terms(question),
+                        "vector": np.frombuffer(vector, dtype=np.float32),
+                        "answer": answer,
+                        "version": version,
+                        "expires": expires,
+                    },
+                )
+
+    def embed(self, question, context=""):
+        text = f"{context}\n{question}" if context else question
+        vector = np.asarray(get_embeddings().embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get_scope(self, address):
+        """Key and data version of the wallet, or of several wallets as a list."""
+        addresses = sorted(
+            a.lower() for a in ([address] if isinstance(address, str) else address)
+        )
+        return ",".join(addresses), "|".join(get_version(a) for a in addresses)
+
+    def lookup(self, question, address, context=""):
+        """
+        The cached answer to a question like `question` asked after the user
+        question `context`, "" at the start of a thread, or None.
+        """
+        context = context or ""
+        vector = self.embed(question, context)
+        terms = get_question_terms(question)
+        address, version = self.get_scope(address)
+        now = time.time()
+        best, best_score = None, self.threshold
+        with self.lock:
+            for entry in self.entries:
+                if (
+                    entry["address"] != address
+                    or entry["context"] != context
+                    or entry["version"] != version
+                    or entry["terms"] != terms
+                    or (entry["expires"] is not None and entry["expires"] < now)
+                ):
+                    continue
+                score = float(vector @ entry["vector"])
+                if score >= best_score:
+                    best, best_score = entry, score
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return best["answer"]
+
+    def get_ttl(self, tools):
+        """Seconds an answer built from `tools` stays valid, 0 to skip caching."""
+        if not tools or any(name not in self.ttls for name in tools):
+            return 0
+        ttls = [self.ttls[name] for name in tools if self.ttls[name] is not None]
+        return min(ttls) if ttls else None
+
+    def store(self, question, address, answer, tools, context=""):
+        ttl = self.get_ttl(tools)
+        if ttl == 0 or not answer:
+            return
+        context = context or ""
+        address, version = self.get_scope(address)
+        entry = {
+            "address": address,
+            "context": context,
+            "question": question,
+            "terms": get_question_terms(question),
+            "vector": self.embed(question, context),
+            "answer": answer,
+            "version": version,
+            "expires": None if ttl is None else time.time() + ttl,
+        }
+        with self.lock:
+            self.entries.append(entry)
+            del self.entries[: -self.maxsize]
+            if self.connection is not None:
+                with self.connection:
+                    self.connection.execute(
+                        "INSERT INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            embedding_model,
+                            entry["address"],
+                            context,
+                            question,
+                            entry["vector"].tobytes(),
+                            answer,
+                            entry["version"],
+                            entry["expires"],
+                        ),
+                    )
+
+
+def report(answers=None):
+    table = Table(title="Response Cache")
+    table.add_column("Cache")
+    for column in ["Entries", "Hits", "Misses", "Hit rate"]:
+        table.add_column(column, justify="right")
+    for name, cache in sorted(caches.items()):
+        total = cache.hits + cache.misses
+        table.add_row(
+            name,
+            str(len(cache.entries)),
+            str(cache.hits),
+            str(cache.misses),
+            f"{cache.hits / total:.0%}" if total else "-",
+        )
+    embeddings = get_embeddings()
+    vectors = embeddings.cache
+    total = vectors.hits + vectors.misses
+    table.add_row(
+        f"embeddings ({embeddings.model})",
+        str(len(vectors)),
+        str(vectors.hits),
+        str(vectors.misses),
+        f"{vectors.hits / total:.0%}" if total else "-",
+    )
+    if answers is not None:
+        total = answers.hits + answers.misses
+        table.add_row(
+            "answers",
+            str(len(answers.entries)),
+            str(answers.hits),
+            str(answers.misses),
+            f"{answers.hits / total:.0%}" if total else "-",
+        )
+    console.print(table)
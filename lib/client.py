@@ -0,0 +1,259 @@
+import time
+import random
+import asyncio
+import weakref
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from rich.table import Table
+
+from lib import tracing
+from lib.utils import console
+from lib.constants import (
+    HTTP_POOL_SIZE,
+    HTTP_RATE_LIMITS,
+    HTTP_RETRIES,
+    HTTP_TIMEOUT,
+)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Takes a token and returns how long to wait before using it."""
+        with self.lock:
+            self.refill()
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def available(self):
+        """Tokens that can be taken now without waiting."""
+        with self.lock:
+            self.refill()
+            return self.tokens
+
+    def acquire(self):
+        time.sleep(self.reserve())
+
+    async def aacquire(self):
+        await asyncio.sleep(self.reserve())
+
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent = deque()
+
+    def record(self, elapsed_ms, status):
+        now = time.monotonic()
+        self.requests += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if status == 429:
+            self.throttled += 1
+        if status is None or status >= 400:
+            self.errors += 1
+        self.recent.append(now)
+        while self.recent and now - self.recent[0] > 60:
+            self.recent.popleft()
+
+
+class HttpClient(requests.Session):
+    """
+    Keep-alive session shared by the Etherscan, OpenSea and CoinGecko calls.
+
+    Every attempt, retries included, waits on its host's token bucket. Attempts
+    that fail with a connection error or a 429/5xx are retried with exponential
+    backoff, honouring Retry-After when the server sends one. `aget` does the
+    same over an httpx client, sharing the buckets and stats.
+    """
+
+    def __init__(
+        self,
+        rate_limits=HTTP_RATE_LIMITS,
+        timeout=HTTP_TIMEOUT,
+        retries=HTTP_RETRIES,
+        pool_size=HTTP_POOL_SIZE,
+    ):
+        super().__init__()
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        # httpx clients are tied to the event loop they were first used on
+        self.async_clients = weakref.WeakKeyDictionary()
+        # an httpx transport to use instead of the network, ie for replaying fixtures
+        self.async_transport = None
+        self.buckets = {host: TokenBucket(rate) for host, rate in rate_limits.items()}
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def get_backoff(self, attempt, response):
+        retry_after = None
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return 0.5 * 2**attempt + random.uniform(0, 0.25)
+
+    def should_retry(self, attempt, response):
+        return attempt < self.retries and (
+            response is None or response.status_code in RETRY_STATUSES
+        )
+
+    def record(self, host, elapsed_ms, status, retried):
+        with self.stats_lock:
+            stats = self.stats.setdefault(host, HostStats())
+            stats.record(elapsed_ms, status)
+            if retried:
+                stats.retries += 1
+
+    def record_throttled(self, host, retried):
+        """Count a throttled response the server sent as a success, ie Etherscan's."""
+        with self.stats_lock:
+            stats = self.stats.setdefault(host, HostStats())
+            stats.throttled += 1
+            if retried:
+                stats.retries += 1
+
+    def request(self, method, url, **kwargs):
+        url_parts = urlparse(url)
+        with tracing.span(url_parts.hostname, "http", method=method, path=url_parts.path) as span:
+            response = self.send_with_retries(method, url, **kwargs)
+            span.set(status=response.status_code, bytes=len(response.content))
+            return response
+
+    def send_with_retries(self, method, url, **kwargs):
+        host = urlparse(url).hostname
+        bucket = self.buckets.get(host)
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.retries + 1):
+            if bucket:
+                bucket.acquire()
+            start = time.perf_counter()
+            response = None
+            try:
+                response = super().request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+                    self.record(host, elapsed_ms, None, False)
+                    raise
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            retry = self.should_retry(attempt, response)
+            status = response.status_code if response is not None else None
+            self.record(host, elapsed_ms, status, retry)
+            if not retry:
+                return response
+            time.sleep(self.get_backoff(attempt, response))
+
+    def has_headroom(self, host, calls=1):
+        """Whether `calls` requests to `host` can go out now without waiting on its bucket."""
+        bucket = self.buckets.get(host)
+        return bucket is None or bucket.available() >= calls
+
+    def get_throttled(self, host):
+        """429 responses from `host` so far."""
+        with self.stats_lock:
+            stats = self.stats.get(host)
+            return stats.throttled if stats else 0
+
+    def get_async_client(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self.async_clients:
+            self.async_clients[loop] = httpx.AsyncClient(
+                timeout=self.timeout,
+                transport=self.async_transport,
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+            )
+        return self.async_clients[loop]
+
+    async def aget(self, url, **kwargs):
+        url_parts = urlparse(url)
+        with tracing.span(url_parts.hostname, "http", method="GET", path=url_parts.path) as span:
+            response = await self.aget_with_retries(url, **kwargs)
+            span.set(status=response.status_code, bytes=len(response.content))
+            return response
+
+    async def aget_with_retries(self, url, **kwargs):
+        host = urlparse(url).hostname
+        bucket = self.buckets.get(host)
+        async_client = self.get_async_client()
+
+        for attempt in range(self.retries + 1):
+            if bucket:
+                await bucket.aacquire()
+            start = time.perf_counter()
+            response = None
+            try:
+                response = await async_client.get(url, **kwargs)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+                    self.record(host, elapsed_ms, None, False)
+                    raise
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            retry = self.should_retry(attempt, response)
+            status = response.status_code if response is not None else None
+            self.record(host, elapsed_ms, status, retry)
+            if not retry:
+                return response
+            await asyncio.sleep(self.get_backoff(attempt, response))
+
+    def report(self):
+        table = Table(title="HTTP Requests")
+        table.add_column("Host")
+        columns = ["Requests", "Last min", "Limit/min", "Retries", "429s", "Errors"]
+        for column in columns + ["Avg ms", "Max ms"]:
+            table.add_column(column, justify="right")
+        with self.stats_lock:
+            for host, stats in sorted(self.stats.items()):
+                bucket = self.buckets.get(host)
+                table.add_row(
+                    host,
+                    str(stats.requests),
+                    str(len(stats.recent)),
+                    f"{bucket.rate * 60:.0f}" if bucket else "-",
+                    str(stats.retries),
+                    str(stats.throttled),
+                    str(stats.errors),
+                    f"{stats.total_ms / stats.requests:.0f}",
+                    f"{stats.max_ms:.0f}",
+                )
+        console.print(table)
+
+
+client = HttpClient()
@@ -4,6 +4,108 @@ OLLAMA_EMBEDDING_MODEL = "nomic-embed-text"
 OPEN_AI_LLM_MODEL = "gpt-4o-mini"
 OPEN_AI_EMBEDDING_MODEL = "text-embedding-3-large"
 
+# EMBEDDING_BACKEND=local embeds offline with feature hashing, no model needed
+LOCAL_EMBEDDING_MODEL = "local-hashing"
+LOCAL_EMBEDDING_DIM = 384
+
+OPENSEA_API_URL = "https://api.opensea.io/api/v2"
+ETHERSCAN_API_URL = "https://api.etherscan.io/v2/api"
+# page size for Etherscan list calls, history is walked page by page
 ETHERSCAN_OFFSET = 1_000
+# documents handed to the embedder at a time while streaming history
+INGEST_BATCH_SIZE = 250
+HTTP_TIMEOUT = 30
+HTTP_RETRIES = 3
+HTTP_POOL_SIZE = 10
+# requests per second allowed per host, CoinGecko's public API allows 30 per minute
+HTTP_RATE_LIMITS = {
+    "api.etherscan.io": 5,
+    "api.opensea.io": 4,
+    "api.coingecko.com": 0.5,
+}
+TXSTORE_PATH = "etherscan_transactions.sqlite"
+# OpenSea holdings and collection events are paged into this snapshot and
+# refreshed once older than CACHE_TTLS["nft_stats"]; a collection's events are
+# fetched NFT_EVENTS_DAYS back unless a question needs more, NFT_MAX_PAGES pages
+# at most per walk
+NFTSTORE_PATH = "opensea_snapshot.sqlite"
+NFT_EVENTS_DAYS = 30
+NFT_MAX_PAGES = 40
 VECTORSTORE_DIR = "etherscan_rag_chroma"
+# name of the per-address store holding every Etherscan filter
+WALLET_INDEX = "wallet"
+# estimated bytes the open wallet indexes may hold before the least recently
+# used ones are closed
+WALLET_MEMORY_BUDGET = 512 * 1024**2
+# rough resident bytes of an open wallet vector store: a fixed cost for the
+# Chroma client, plus per row on top of its float32 vector (index links, the
+# document, metadata and SQLite pages)
+VECTORSTORE_OPEN_BYTES = 48 * 1024**2
+VECTORSTORE_ROW_BYTES = 16 * 1024
 WHITEPAPER_URL = "https://ethereum.org/content/whitepaper/whitepaper-pdf/Ethereum_Whitepaper_-_Buterin_2014.pdf"
+# the knowledge base is the whitepaper plus every .pdf, .md and .txt file under
+# KNOWLEDGE_DIR (EIPs, the yellow paper), chunked and embedded by build_index.py
+# into a prebuilt index that is memory-mapped at startup
+KNOWLEDGE_DIR = "knowledge"
+KNOWLEDGE_INDEX_DIR = "knowledge_index"
+
+ETHERSCAN_MAX_CONCURRENCY = 3
+# during a REPL session the chain head is polled every BLOCK_WATCH_INTERVAL
+# seconds (about one block) while the wallet sees new transactions, backing off
+# to BLOCK_WATCH_MAX_INTERVAL while it is quiet or Etherscan throttles
+BLOCK_WATCH_INTERVAL = 12
+BLOCK_WATCH_MAX_INTERVAL = 120
+EMBED_WORKERS = 4
+# vectors are cached per model and text, misses are embedded in batches
+EMBEDDING_CACHE_DIR = "embedding_cache"
+EMBED_BATCH_SIZE = 128
+EMBED_CONCURRENCY = 2
+# hybrid retrieval: candidates taken from BM25 and from vector search before
+# reciprocal rank fusion, and the fusion's rank offset
+RETRIEVAL_CANDIDATES = 20
+RRF_K = 60
+
+# retrievers built in the background at startup, the rest are built on first use
+PREWARM_TOOLS = ["eth_balance", "normal_transaction"]
+
+# set RESPONSE_CACHE_PATH to None to keep the tool response cache in memory only
+RESPONSE_CACHE_PATH = "response_cache.sqlite"
+RESPONSE_CACHE_SIZE = 1_024
+# seconds each kind of tool response stays fresh, None never expires
+CACHE_TTLS = {
+    "spot_price": 30,
+    "historical_price": None,
+    "trending": 300,
+    "nft_stats": 300,
+    "nft_metadata": 3_600,
+    "coin_ids": 86_400,
+    "wallet": 600,
+    "search": 3_600,
+}
+
+# earlier answers are reused for questions this similar (cosine) while the
+# wallet's stored history is unchanged and the TTLs of the tools used hold
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_SIZE = 256
+
+# conversations are checkpointed here and can be resumed with --thread
+CHECKPOINT_PATH = "checkpoints.sqlite"
+# past this many tokens of history, tool outputs over COMPACTION_TOOL_OUTPUT_TOKENS
+# from before the current turn are dropped, then the turns before the last
+# COMPACTION_KEEP_TURNS are summarized if that wasn't enough
+COMPACTION_TOKEN_THRESHOLD = 6_000
+COMPACTION_KEEP_TURNS = 2
+COMPACTION_TOOL_OUTPUT_TOKENS = 200
+
+# each user turn binds only the TOOL_SELECTION_TOP_K tools whose descriptions
+# are most similar to the question, plus the pinned ones; 0 binds every tool
+TOOL_SELECTION_TOP_K = 6
+PINNED_TOOLS = ["get_stored_result"]
+
+# with --trace, the spans of every turn are appended here as JSON lines
+TRACE_PATH = "traces.jsonl"
+
+# tool outputs larger than this many tokens are trimmed, the full payload is kept
+# for paging in a store of the last RESULT_STORE_SIZE results
+TOOL_OUTPUT_TOKEN_BUDGET = 1_500
+RESULT_STORE_SIZE = 50
@@ -0,0 +1,228 @@
+import os
+import re
+import fcntl
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from lib import tracing
+from lib.constants import (
+    EMBED_BATCH_SIZE,
+    EMBED_CONCURRENCY,
+    EMBEDDING_CACHE_DIR,
+    LOCAL_EMBEDDING_DIM,
+)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Offline embedder: word and word-pair counts hashed into `dim` signed
+    buckets, L2-normalised. Deterministic, so indexes built with it can be
+    compared across runs and machines.
+    """
+
+    def __init__(self, dim=LOCAL_EMBEDDING_DIM):
+        self.dim = dim
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dim] += 1.0 if value >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed(text)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed vectors for one embedding model. Vectors are appended to
+    a raw float32 file read back through a memory map; a SQLite table maps the
+    hash of each text to its row. Rows written without an index entry (a crash
+    between the two writes) are just unused space. Processes sharing the
+    directory append under an exclusive lock on the vector file.
+    """
+
+    def __init__(self, model, directory=EMBEDDING_CACHE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r"[^a-zA-Z0-9_.-]", "_", model)
+        self.model = model
+        self.vectors_path = os.path.join(directory, f"{name}.f32")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.view = None
+
+        self.connection = sqlite3.connect(
+            os.path.join(directory, f"{name}.sqlite"), check_same_thread=False
+        )
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, row INTEGER)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)"
+            )
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE name = 'dim'"
+        ).fetchone()
+        self.dim = row[0] if row else None
+
+    def get_key(self, text, kind="document"):
+        # some models embed queries differently from documents
+        key = f"{self.model}\0{kind}\0{text}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def get_view(self, rows):
+        # remap only when rows were appended since the last map
+        if self.view is None or len(self.view) < rows:
+            # whole rows only, the file may end in a row still being appended
+            whole = os.path.getsize(self.vectors_path) // (self.dim * 4)
+            self.view = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(whole, self.dim)
+            )
+        return self.view
+
+    def get_many(self, keys):
+        """Cached vectors by key; keys not cached are left out."""
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                found.update(
+                    self.connection.execute(
+                        f"SELECT key, row FROM vectors WHERE key IN "
+                        f"({', '.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                )
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+            if not found:
+                return {}
+            view = self.get_view(max(found.values()) + 1)
+            return {key: view[row].tolist() for key, row in found.items()}
+
+    def put_many(self, vectors):
+        """Append `vectors` (key to vector) not cached yet."""
+        with self.lock:
+            if self.dim is None:
+                self.dim = len(next(iter(vectors.values())))
+                with self.connection:
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (self.dim,)
+                    )
+            with open(self.vectors_path, "ab") as f:
+                # row numbers come from the file, another process may have appended
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    self.append(f, vectors)
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def append(self, f, vectors):
+        keys = list(vectors)
+        stored = {
+            key
+            for (key,) in self.connection.execute(
+                f"SELECT key FROM vectors WHERE key IN "
+                f"({', '.join('?' * len(keys))})",
+                keys,
+            )
+        }
+        keys = [key for key in keys if key not in stored]
+        if not keys:
+            return
+        row_size = self.dim * 4
+        f.seek(0, 2)
+        end = f.tell()
+        if end % row_size:
+            # drop a partly written trailing vector
+            end -= end % row_size
+            f.truncate(end)
+        start = end // row_size
+        data = np.asarray([vectors[key] for key in keys], dtype=np.float32)
+        f.write(data.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO vectors VALUES (?, ?)",
+                [(key, start + i) for i, key in enumerate(keys)],
+            )
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedder with an `EmbeddingCache`. Only texts not cached are sent
+    to it, deduplicated, in batches of `batch_size` with at most `concurrency`
+    batches in flight.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        model,
+        batch_size=EMBED_BATCH_SIZE,
+        concurrency=EMBED_CONCURRENCY,
+    ):
+        self.embeddings = embeddings
+        self.model = model
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.cache = EmbeddingCache(model)
+
+    def embed_documents(self, texts):
+        with tracing.span("documents", "embedding") as span:
+            keys = [self.cache.get_key(text) for text in texts]
+            vectors = self.cache.get_many(list(set(keys)))
+
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in vectors:
+                    missing.setdefault(key, text)
+            span.set(cache_hits=len(vectors), cache_misses=len(missing))
+            if missing:
+                items = list(missing.items())
+                batches = [
+                    items[start : start + self.batch_size]
+                    for start in range(0, len(items), self.batch_size)
+                ]
+                embed_batch = tracing.bind(self.embed_batch)
+                with ThreadPoolExecutor(min(self.concurrency, len(batches))) as pool:
+                    for batch_vectors in pool.map(embed_batch, batches):
+                        vectors.update(batch_vectors)
+
+            return [vectors[key] for key in keys]
+
+    def embed_batch(self, batch):
+        with tracing.span(self.model, "embedding", texts=len(batch)):
+            embedded = self.embeddings.embed_documents([text for _, text in batch])
+        batch_vectors = {key: vector for (key, _), vector in zip(batch, embedded)}
+        # written per batch so a failure later on keeps the finished ones
+        self.cache.put_many(batch_vectors)
+        return batch_vectors
+
+    def embed_query(self, text):
+        with tracing.span("query", "embedding") as span:
+            key = self.cache.get_key(text, kind="query")
+            vector = self.cache.get_many([key]).get(key)
+            span.set(cache_hits=int(vector is not None), cache_misses=int(vector is None))
+            if vector is None:
+                vector = self.embeddings.embed_query(text)
+                self.cache.put_many({key: vector})
+            return vector
@@ -0,0 +1,178 @@
+import os
+import time
+from urllib.parse import urlparse
+
+from langchain_core.documents import Document
+
+from lib.client import client
+from lib.constants import ETHERSCAN_API_URL, ETHERSCAN_OFFSET, INGEST_BATCH_SIZE
+
+ACTIONS = {
+    "normal_transaction": "txlist",
+    "internal_transaction": "txlistinternal",
+    "erc20_transaction": "tokentx",
+    "erc721_transaction": "tokennfttx",
+    "erc1155_transaction": "token1155tx",
+}
+
+MAX_BLOCK = 99999999
+ETHERSCAN_HOST = urlparse(ETHERSCAN_API_URL).hostname
+
+
+def request(params):
+    """
+    One Etherscan call. Throttling comes back as a 200 with a rate limit
+    error, it is retried with the client's backoff and counted as a 429.
+    """
+    params = {"chainid": 1, "apikey": os.getenv("ETHERSCAN_API_KEY"), **params}
+    for attempt in range(client.retries + 1):
+        response = client.get(ETHERSCAN_API_URL, params=params)
+        response.raise_for_status()
+        data = response.json()
+        if "error" in data:
+            raise ValueError(f"Etherscan error: {data['error']}")
+        if data.get("status") != "0":
+            return data["result"]
+        if "No transactions found" in data.get("message", ""):
+            return []
+        error = f"{data.get('result') or data.get('message')}"
+        if "rate limit" not in error.lower():
+            break
+        retry = attempt < client.retries
+        client.record_throttled(ETHERSCAN_HOST, retry)
+        if not retry:
+            break
+        time.sleep(client.get_backoff(attempt, None))
+    raise ValueError(f"Etherscan error: {error}")
+
+
+def fetch_page(filter, address, start_block, end_block=MAX_BLOCK, page=1):
+    """One page of `filter` rows in ascending block order."""
+    return request(
+        {
+            "module": "account",
+            "action": ACTIONS[filter],
+            "address": address,
+            "startblock": start_block,
+            "endblock": end_block,
+            "page": page,
+            "offset": ETHERSCAN_OFFSET,
+            "sort": "asc",
+        }
+    )
+
+
+def get_row_key(item):
+    # token and internal rows share the tx hash, so key on the whole row
+    return tuple(sorted(item.items()))
+
+
+def iter_transactions(filter, address, start_block=0):
+    """
+    Walk the full history of `filter` from `start_block` by block range.
+
+    Each page starts at the last block of the previous one, since a page can end
+    in the middle of a block; rows already seen in that block are skipped.
+    Only one page is held in memory at a time.
+    """
+    start_block = start_block or 0
+    seen = set()
+    while True:
+        items = [
+            clean_row(item) for item in fetch_page(filter, address, start_block)
+        ]
+        for item in items:
+            if get_row_key(item) not in seen:
+                yield item
+
+        if len(items) < ETHERSCAN_OFFSET:
+            return
+
+        last_block = int(items[-1]["blockNumber"])
+        if last_block == start_block:
+            # a whole page inside one block, page through that block alone
+            seen |= {get_row_key(item) for item in items}
+            yield from iter_block(filter, address, last_block, seen)
+            start_block = last_block + 1
+            seen = set()
+        else:
+            start_block = last_block
+            seen = {
+                get_row_key(item)
+                for item in items
+                if int(item["blockNumber"]) == last_block
+            }
+
+
+def iter_block(filter, address, block, seen):
+    page = 2
+    while True:
+        items = [
+            clean_row(item)
+            for item in fetch_page(filter, address, block, block, page=page)
+        ]
+        for item in items:
+            if get_row_key(item) not in seen:
+                yield item
+        if len(items) < ETHERSCAN_OFFSET:
+            return
+        page += 1
+
+
+def clean_row(item):
+    # confirmations grows with every new block and would change the content hash
+    return {k: v for k, v in item.items() if k != "confirmations"}
+
+
+def get_block_number():
+    """The latest block number."""
+    # proxy calls answer in JSON-RPC form, without a status
+    return int(request({"module": "proxy", "action": "eth_blockNumber"}), 16)
+
+
+def get_eth_balance(address):
+    return request(
+        {"module": "account", "action": "balance", "address": address, "tag": "latest"}
+    )
+
+
+def to_document(item, filter, address):
+    """
+    An Etherscan row as a document. The metadata holds what the wallet index
+    filters on; Chroma metadata values can't be None, so missing ones are empty.
+    """
+    sender = item.get("from", "").lower()
+    receiver = item.get("to", "").lower()
+    return Document(
+        page_content=str(item),
+        metadata={
+            "from": sender,
+            "to": receiver,
+            "tx_hash": item["hash"],
+            "transaction_type": filter,
+            "block_number": int(item["blockNumber"]),
+            "timestamp": int(item["timeStamp"]),
+            "token": (item.get("tokenSymbol") or "ETH").upper(),
+            "counterparty": receiver if sender == address.lower() else sender,
+        },
+    )
+
+
+def get_balance_document(address):
+    wei = int(get_eth_balance(address))
+    return Document(
+        page_content=f"ETH balance of {address}: {wei} wei ({wei / 10**18:.6f} ETH)",
+        metadata={"transaction_type": "eth_balance", "token": "ETH"},
+    )
+
+
+def iter_row_batches(filter, address, start_block=0, batch_size=INGEST_BATCH_SIZE):
+    """Yield `filter` history as lists of at most `batch_size` raw rows."""
+    batch = []
+    for item in iter_transactions(filter, address, start_block):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,192 @@
+import re
+import math
+import threading
+from collections import Counter
+
+from langchain_core.retrievers import BaseRetriever
+
+from lib import tracing
+from lib.store import get_doc_id
+from lib.constants import RETRIEVAL_CANDIDATES, RRF_K
+
+HEX_RE = re.compile(r"0x[0-9a-f]{64}|0x[0-9a-f]{40}")
+BLOCK_RE = re.compile(r"\bblock(?:\s+number)?\s*#?\s*(\d+)")
+TOKEN_RE = re.compile(r"0x[0-9a-f]+|[a-z0-9]+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def get_query_identifiers(query, blocks=True):
+    """Tx hashes, addresses and, if `blocks`, `block N` references in a query, as index keys."""
+    query = query.lower()
+    blocks = [f"block:{int(block)}" for block in BLOCK_RE.findall(query)] if blocks else []
+    return HEX_RE.findall(query) + blocks
+
+
+def get_doc_identifiers(doc):
+    keys = set(HEX_RE.findall(doc.page_content.lower()))
+    for key in ("tx_hash", "from", "to", "counterparty"):
+        if doc.metadata.get(key):
+            keys.add(doc.metadata[key].lower())
+    if doc.metadata.get("block_number") is not None:
+        keys.add(f"block:{int(doc.metadata['block_number'])}")
+    return keys
+
+
+def get_memory(doc, terms):
+    # the text and metadata plus one dict entry per posting and identifier
+    return (
+        len(doc.page_content)
+        + len(str(doc.metadata))
+        + 100 * (len(terms) + len(get_doc_identifiers(doc)))
+    )
+
+
+class LexicalIndex:
+    """
+    In-memory inverted indexes over a document set: exact identifiers (hashes,
+    addresses, block numbers) to documents, and terms to per-document counts
+    for BM25 ranking.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = {}
+        self.exact = {}
+        self.postings = {}
+        self.lengths = {}
+        self.total_length = 0
+        # rough bytes held, for the wallet memory budget
+        self.memory = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, docs):
+        with self.lock:
+            for doc in docs:
+                doc_id = get_doc_id(doc)
+                if doc_id in self.docs:
+                    continue
+                self.docs[doc_id] = doc
+                for key in get_doc_identifiers(doc):
+                    self.exact.setdefault(key, set()).add(doc_id)
+                terms = Counter(tokenize(doc.page_content))
+                for term, count in terms.items():
+                    self.postings.setdefault(term, {})[doc_id] = count
+                self.lengths[doc_id] = sum(terms.values())
+                self.total_length += self.lengths[doc_id]
+                self.memory += get_memory(doc, terms)
+
+    def remove(self, predicate):
+        """Drop the documents whose metadata matches `predicate`."""
+        with self.lock:
+            doc_ids = [
+                doc_id for doc_id, doc in self.docs.items() if predicate(doc.metadata)
+            ]
+            for doc_id in doc_ids:
+                doc = self.docs.pop(doc_id)
+                for key in get_doc_identifiers(doc):
+                    self.exact[key].discard(doc_id)
+                    if not self.exact[key]:
+                        del self.exact[key]
+                terms = set(tokenize(doc.page_content))
+                for term in terms:
+                    self.postings[term].pop(doc_id, None)
+                    if not self.postings[term]:
+                        del self.postings[term]
+                self.total_length -= self.lengths.pop(doc_id)
+                self.memory -= get_memory(doc, terms)
+
+    def lookup(self, keys, k, predicate=None):
+        """Documents holding every identifier in `keys`, newest block first."""
+        with self.lock:
+            doc_ids = set.intersection(*(self.exact.get(key, set()) for key in keys))
+            docs = [self.docs[doc_id] for doc_id in doc_ids]
+        if predicate:
+            docs = [doc for doc in docs if predicate(doc.metadata)]
+        docs.sort(key=lambda doc: -(doc.metadata.get("block_number") or 0))
+        return docs[:k]
+
+    def search(self, query, k, predicate=None):
+        """Top `k` BM25 matches for `query` as (doc_id, document) pairs."""
+        with self.lock:
+            if not self.docs:
+                return []
+            count = len(self.docs)
+            average = self.total_length / count
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (
+                        self.k1 + 1
+                    ) / (tf + norm)
+            ranked = sorted(scores, key=scores.get, reverse=True)
+            matches = []
+            for doc_id in ranked:
+                doc = self.docs[doc_id]
+                if predicate is None or predicate(doc.metadata):
+                    matches.append((doc_id, doc))
+                    if len(matches) == k:
+                        break
+            return matches
+
+
+def fuse(rankings, k, rrf_k=RRF_K):
+    """Reciprocal rank fusion of (doc_id, document) rankings."""
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, (doc_id, doc) in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (rrf_k + rank + 1)
+            docs.setdefault(doc_id, doc)
+    return [docs[doc_id] for doc_id in sorted(scores, key=scores.get, reverse=True)[:k]]
+
+
+def hybrid_search(query, lexical, vector_search, k=4, predicate=None, blocks=True):
+    """
+    Exact identifier lookup when the query names hashes, addresses or, if
+    `blocks`, blocks, without embedding the query. Otherwise, or when no
+    document has those identifiers, BM25 and `vector_search(n)` candidates
+    fused by reciprocal rank.
+    """
+    keys = get_query_identifiers(query, blocks)
+    if keys:
+        with tracing.span("exact", "search", keys=len(keys)) as span:
+            docs = lexical.lookup(keys, k, predicate)
+            span.set(documents=len(docs))
+        if docs:
+            return docs
+    with tracing.span("bm25", "search"):
+        bm25 = lexical.search(query, RETRIEVAL_CANDIDATES, predicate)
+    with tracing.span("vector", "search"):
+        vector = [(get_doc_id(doc), doc) for doc in vector_search(RETRIEVAL_CANDIDATES)]
+    return fuse([bm25, vector], k)
+
+
+class HybridRetriever(BaseRetriever):
+    """`hybrid_search` over a vector store and a lexical index of the same docs."""
+
+    vectorstore: object
+    lexical: LexicalIndex
+    k: int = 4
+    # `block N` means a chain block only in indexes of transactions
+    blocks: bool = True
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return hybrid_search(
+            query,
+            self.lexical,
+            lambda n: self.vectorstore.similarity_search(query, k=n),
+            self.k,
+            blocks=self.blocks,
+        )
@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+
+import numpy as np
+from langchain_core.documents import Document
+
+from lib.llm import embedding_model, get_embeddings
+from lib.utils import split_docs
+from lib.constants import KNOWLEDGE_DIR, KNOWLEDGE_INDEX_DIR, WHITEPAPER_URL
+
+# bump when the artifact layout changes, older artifacts are rebuilt
+FORMAT_VERSION = 1
+CHUNK_SIZE = 100
+CHUNK_OVERLAP = 50
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.f32"
+CHUNKS_FILE = "chunks.jsonl"
+
+# imported when a document is loaded, only builds need them
+LOADERS = {".pdf": "PyPDFLoader", ".md": "TextLoader", ".txt": "TextLoader"}
+
+
+def is_url(source):
+    return source.startswith(("http://", "https://"))
+
+
+def get_sources(directory=KNOWLEDGE_DIR):
+    """The whitepaper and every supported file under `directory`."""
+    sources = [WHITEPAPER_URL]
+    if os.path.isdir(directory):
+        for root, _, names in sorted(os.walk(directory)):
+            for name in sorted(names):
+                if os.path.splitext(name)[1].lower() in LOADERS:
+                    sources.append(os.path.join(root, name))
+    return sources
+
+
+def get_settings():
+    """What the vectors and chunks depend on; an artifact built otherwise is rebuilt."""
+    return {
+        "format": FORMAT_VERSION,
+        "embedding_model": embedding_model,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
+
+
+def get_file_stamp(source):
+    stat = os.stat(source)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def hash_file(source):
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_docs(docs):
+    digest = hashlib.sha256()
+    for doc in docs:
+        digest.update(doc.page_content.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_source(source):
+    extension = ".pdf" if is_url(source) else os.path.splitext(source)[1].lower()
+    from langchain_community import document_loaders
+
+    docs = getattr(document_loaders, LOADERS[extension])(source).load()
+    for doc in docs:
+        doc.metadata["source"] = source
+    return docs
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class KnowledgeIndex:
+    """
+    A prebuilt index artifact: a manifest, the chunks as JSON lines and their
+    normalized vectors as one float32 file that is memory-mapped rather than
+    read. It answers `similarity_search` like a vector store, by brute force,
+    which is plenty for a corpus of a few documents.
+    """
+
+    def __init__(self, directory=KNOWLEDGE_INDEX_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(directory, CHUNKS_FILE)) as f:
+            self.docs = [
+                Document(page_content=chunk["text"], metadata=chunk["metadata"])
+                for chunk in map(json.loads, f)
+            ]
+        rows, dim = self.manifest["rows"], self.manifest["dim"]
+        if rows:
+            self.vectors = np.memmap(
+                os.path.join(directory, VECTORS_FILE),
+                dtype=np.float32,
+                mode="r",
+                shape=(rows, dim),
+            )
+        else:
+            self.vectors = np.zeros((0, dim or 1), dtype=np.float32)
+
+    @property
+    def is_compatible(self):
+        return all(self.manifest.get(k) == v for k, v in get_settings().items())
+
+    def get_stale_sources(self, sources):
+        """
+        Sources missing from the index, local files changed since it was built,
+        and indexed local files that no longer exist.
+        """
+        built = self.manifest["sources"]
+        stale = [
+            source
+            for source in sources
+            if source not in built
+            or (not is_url(source) and built[source].get("stamp") != get_file_stamp(source))
+        ]
+        return stale + [
+            source for source in built if not is_url(source) and not os.path.exists(source)
+        ]
+
+    def get_rows(self, source):
+        entry = self.manifest["sources"][source]
+        return self.docs[entry["start"] : entry["end"]], self.vectors[entry["start"] : entry["end"]]
+
+    def similarity_search(self, query, k=4, filter=None):
+        if not len(self.docs):
+            return []
+        vector = normalize([get_embeddings().embed_query(query)])[0]
+        scores = self.vectors @ vector
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [self.docs[i] for i in top[np.argsort(-scores[top])]]
+
+
+def open_index(directory=KNOWLEDGE_INDEX_DIR):
+    """The artifact in `directory` if there is one built with the current settings."""
+    if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        return None
+    index = KnowledgeIndex(directory)
+    return index if index.is_compatible else None
+
+
+def build_index(sources=None, directory=KNOWLEDGE_INDEX_DIR, refresh=False):
+    """
+    Build the index artifact for `sources`, returning each source's status.
+
+    Only the delta is built: a source already in the artifact is carried over
+    unless its content changed. Local files are compared by hash; URLs are
+    trusted as they are unless `refresh`, then refetched and compared by their
+    text. A source that fails to load keeps its old chunks if it has any and is
+    otherwise left out, to be retried next build. The new artifact is written
+    next to the old one and swapped in, with its version bumped.
+    """
+    sources = sources if sources is not None else get_sources()
+    old = open_index(directory)
+    old_sources = old.manifest["sources"] if old else {}
+
+    statuses, entries = {}, []
+    for source in sources:
+        previous = old_sources.get(source)
+        try:
+            entries.append(build_entry(source, previous, old, refresh, statuses))
+        except Exception as e:
+            # only this source is left out, or kept as it was built before
+            if previous:
+                statuses[source] = f"kept, failed to load: {e}"
+                kept = {key: value for key, value in previous.items() if key not in ("start", "end")}
+                entries.append((source, kept, *old.get_rows(source)))
+            else:
+                statuses[source] = f"skipped: {e}"
+
+    for source in old_sources:
+        if source not in statuses:
+            statuses[source] = "removed"
+    # a touched but unchanged file is rewritten too, for its new stamp
+    built = {source: entry for source, entry, _, _ in entries}
+    if old is not None and built == {
+        source: {key: value for key, value in entry.items() if key not in ("start", "end")}
+        for source, entry in old_sources.items()
+    }:
+        return statuses
+
+    write_index(directory, entries, (old.manifest["version"] if old else 0) + 1)
+    return statuses
+
+
+def build_entry(source, previous, old, refresh, statuses):
+    """The (source, entry, chunks, vectors) for one source, carried over when unchanged."""
+    if previous and is_url(source) and not refresh:
+        docs = None
+        fingerprint = previous["fingerprint"]
+    elif is_url(source):
+        docs = load_source(source)
+        fingerprint = hash_docs(docs)
+    else:
+        docs = None
+        fingerprint = hash_file(source)
+
+    entry = {"fingerprint": fingerprint}
+    if not is_url(source):
+        entry["stamp"] = get_file_stamp(source)
+    if previous and previous["fingerprint"] == fingerprint:
+        statuses[source] = "unchanged"
+        return (source, entry, *old.get_rows(source))
+
+    chunks = split_docs(docs or load_source(source), CHUNK_SIZE, CHUNK_OVERLAP, quiet=True)
+    texts = [chunk.page_content for chunk in chunks]
+    vectors = normalize(get_embeddings().embed_documents(texts)) if texts else None
+    statuses[source] = f"built, {len(chunks)} chunks"
+    return source, entry, chunks, vectors
+
+
+def write_index(directory, entries, version):
+    tmp = f"{directory}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    manifest = {
+        **get_settings(),
+        "version": version,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "dim": None,
+        "rows": 0,
+        "sources": {},
+    }
+    with open(os.path.join(tmp, CHUNKS_FILE), "w") as chunks_file, open(
+        os.path.join(tmp, VECTORS_FILE), "wb"
+    ) as vectors_file:
+        for source, entry, chunks, vectors in entries:
+            start = manifest["rows"]
+            for chunk in chunks:
+                chunks_file.write(
+                    json.dumps({"text": chunk.page_content, "metadata": chunk.metadata}, default=str)
+                    + "\n"
+                )
+            if len(chunks):
+                manifest["dim"] = int(vectors.shape[1])
+                vectors_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            manifest["rows"] += len(chunks)
+            manifest["sources"][source] = {**entry, "start": start, "end": manifest["rows"]}
+    with open(os.path.join(tmp, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # readers holding the old files keep them, they are unlinked, not rewritten
+    old = f"{directory}.old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(directory):
+        os.replace(directory, old)
+    os.replace(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def load_index(directory=KNOWLEDGE_INDEX_DIR):
+    """
+    The knowledge index, building the delta first when the artifact is missing,
+    was built for another embedding model, or lacks, has stale or has deleted
+    sources.
+    """
+    index = open_index(directory)
+    if index is None or index.get_stale_sources(get_sources()):
+        build_index(directory=directory)
+        index = open_index(directory)
+    return index
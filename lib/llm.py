@@ -1,24 +1,54 @@
 import os
+import functools
 from dotenv import load_dotenv
 
-from langchain_ollama import OllamaEmbeddings, ChatOllama
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-
 from lib.constants import (
     OPEN_AI_LLM_MODEL,
     OPEN_AI_EMBEDDING_MODEL,
     OLLAMA_LLM_MODEL,
     OLLAMA_EMBEDDING_MODEL,
+    LOCAL_EMBEDDING_MODEL,
 )
 
 load_dotenv()
 
+# the clients and their SDKs are slow to import, so they are built on first
+# use; the model names are known up front for cache and index keys
+use_openai = os.getenv("OPENAI_API_KEY") is not None
 
-if os.getenv("OPENAI_API_KEY") is not None:
-    llm = ChatOpenAI(model=OPEN_AI_LLM_MODEL, api_key=os.getenv("OPENAI_API_KEY"))
-    embeddings = OpenAIEmbeddings(
-        model=OPEN_AI_EMBEDDING_MODEL, api_key=os.getenv("OPENAI_API_KEY")
-    )
+if os.getenv("EMBEDDING_BACKEND") == "local":
+    embedding_model = LOCAL_EMBEDDING_MODEL
+elif use_openai:
+    embedding_model = OPEN_AI_EMBEDDING_MODEL
 else:
-    llm = ChatOllama(model=OLLAMA_LLM_MODEL)
-    embeddings = OllamaEmbeddings(model=OLLAMA_EMBEDDING_MODEL)
+    embedding_model = OLLAMA_EMBEDDING_MODEL
+
+
+@functools.cache
+def get_llm():
+    if use_openai:
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(model=OPEN_AI_LLM_MODEL, api_key=os.getenv("OPENAI_API_KEY"))
+    from langchain_ollama import ChatOllama
+
+    return ChatOllama(model=OLLAMA_LLM_MODEL)
+
+
+@functools.cache
+def get_embeddings():
+    from lib.embeddings import CachedEmbeddings, HashingEmbeddings
+
+    if embedding_model == LOCAL_EMBEDDING_MODEL:
+        embeddings = HashingEmbeddings()
+    elif use_openai:
+        from langchain_openai import OpenAIEmbeddings
+
+        embeddings = OpenAIEmbeddings(
+            model=OPEN_AI_EMBEDDING_MODEL, api_key=os.getenv("OPENAI_API_KEY")
+        )
+    else:
+        from langchain_ollama import OllamaEmbeddings
+
+        embeddings = OllamaEmbeddings(model=OLLAMA_EMBEDDING_MODEL)
+    return CachedEmbeddings(embeddings, embedding_model)
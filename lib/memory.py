@@ -0,0 +1,110 @@
+import json
+
+from langchain_core.messages import (
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from lib.projection import count_tokens
+from lib.constants import (
+    COMPACTION_KEEP_TURNS,
+    COMPACTION_TOKEN_THRESHOLD,
+    COMPACTION_TOOL_OUTPUT_TOKENS,
+)
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+SUMMARY_PROMPT = """Summarize this conversation between a user and a crypto assistant for the assistant's own future reference. Keep every fact, figure, address, transaction hash and date the user may ask about again, and what the user wanted. Be brief."""
+
+
+def count_message_tokens(messages):
+    return sum(
+        count_tokens(message.content) + count_tokens(getattr(message, "tool_calls", []))
+        for message in messages
+    )
+
+
+def get_turn_start(messages, turns):
+    """Index of the message opening the last `turns` user turns."""
+    starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+    return starts[-turns] if len(starts) >= turns else 0
+
+
+def drop_tool_output(message):
+    if (
+        not isinstance(message, ToolMessage)
+        or count_tokens(message.content) <= COMPACTION_TOOL_OUTPUT_TOKENS
+    ):
+        return message
+    return ToolMessage(
+        id=message.id,
+        name=message.name,
+        tool_call_id=message.tool_call_id,
+        content=f"[{message.name} output dropped to save context, call it again if needed]",
+    )
+
+
+def is_summary(message):
+    return isinstance(message, SystemMessage) and message.content.startswith(SUMMARY_PREFIX)
+
+
+def render(messages):
+    lines = []
+    for message in messages:
+        content = message.content
+        if not isinstance(content, str):
+            content = json.dumps(content, default=str)
+        calls = getattr(message, "tool_calls", None)
+        if calls:
+            content += " " + json.dumps(
+                [{call["name"]: call["args"]} for call in calls], default=str
+            )
+        lines.append(f"{message.type}: {content[:2_000]}")
+    return "\n".join(lines)
+
+
+def get_compaction_hook(get_model):
+    """
+    A `pre_model_hook` keeping the thread under COMPACTION_TOKEN_THRESHOLD. The
+    last COMPACTION_KEEP_TURNS user turns are kept, only their large tool
+    outputs from before the current turn are dropped. Before them, large tool
+    outputs are dropped first; if that isn't enough, the older turns are
+    replaced by one summary message, unless they are already just that. The
+    compacted history is written back to the thread, so the work is done once
+    rather than on every call; what compaction can't shrink is left as it is.
+    """
+
+    async def compact(state):
+        messages = state["messages"]
+        if count_message_tokens(messages) <= COMPACTION_TOKEN_THRESHOLD:
+            return {"llm_input_messages": messages}
+
+        cut = get_turn_start(messages, COMPACTION_KEEP_TURNS)
+        # the turn being answered keeps its tool outputs, the model is reading them
+        current = get_turn_start(messages, 1)
+        old = [drop_tool_output(message) for message in messages[:cut]]
+        recent = [drop_tool_output(message) for message in messages[cut:current]]
+        recent += messages[current:]
+        if count_message_tokens(old + recent) > COMPACTION_TOKEN_THRESHOLD and not all(
+            is_summary(message) for message in old
+        ):
+            summary = await get_model().ainvoke(
+                [SystemMessage(content=SUMMARY_PROMPT), HumanMessage(render(old))]
+            )
+            old = [SystemMessage(content=f"{SUMMARY_PREFIX}\n{summary.content}")]
+
+        compacted = old + recent
+        if len(compacted) == len(messages) and all(
+            a is b for a, b in zip(compacted, messages)
+        ):
+            # nothing left to compact, don't rewrite the thread
+            return {"llm_input_messages": messages}
+        return {
+            "messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *compacted],
+            "llm_input_messages": compacted,
+        }
+
+    return compact
@@ -0,0 +1,321 @@
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import weakref
+
+from lib.opensea import iter_pages
+from lib.constants import CACHE_TTLS, NFT_EVENTS_DAYS, NFTSTORE_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS holdings (
+    address TEXT NOT NULL,
+    contract TEXT NOT NULL,
+    identifier TEXT NOT NULL,
+    collection TEXT,
+    name TEXT,
+    token_standard TEXT,
+    raw TEXT NOT NULL,
+    PRIMARY KEY (address, contract, identifier)
+);
+CREATE TABLE IF NOT EXISTS holding_syncs (
+    address TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL,
+    next_cursor TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    collection TEXT NOT NULL,
+    event_key TEXT NOT NULL,
+    event_type TEXT,
+    event_timestamp INTEGER,
+    tx_hash TEXT,
+    contract TEXT,
+    identifier TEXT,
+    seller TEXT,
+    buyer TEXT,
+    quantity INTEGER,
+    price REAL,
+    symbol TEXT,
+    raw TEXT NOT NULL,
+    PRIMARY KEY (collection, event_key)
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (collection, event_timestamp);
+CREATE TABLE IF NOT EXISTS event_syncs (
+    collection TEXT PRIMARY KEY,
+    covered_from INTEGER NOT NULL,
+    last_timestamp INTEGER,
+    synced_at REAL NOT NULL
+);
+"""
+
+HOLDINGS_PAGE_SIZE = 200
+EVENTS_PAGE_SIZE = 50
+
+local = threading.local()
+# asyncio locks belong to one event loop
+sync_locks = weakref.WeakKeyDictionary()
+
+
+def get_connection():
+    """One SQLite connection per thread, the schema is created on first use."""
+    if getattr(local, "connection", None) is None:
+        connection = sqlite3.connect(NFTSTORE_PATH, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(holding_syncs)")]
+        if columns and "next_cursor" not in columns:
+            # older syncs didn't record whether the walk was cut short, redo them
+            connection.execute("DROP TABLE holding_syncs")
+        connection.executescript(SCHEMA)
+        local.connection = connection
+    return local.connection
+
+
+def get_sync_lock(key):
+    locks = sync_locks.setdefault(asyncio.get_running_loop(), {})
+    return locks.setdefault(key, asyncio.Lock())
+
+
+def is_fresh(synced_at):
+    return synced_at is not None and time.time() - synced_at < CACHE_TTLS["nft_stats"]
+
+
+def get_price(event):
+    payment = event.get("payment")
+    if not payment:
+        return None, None
+    decimals = int(payment.get("decimals") or 0)
+    return int(payment.get("quantity") or 0) / 10**decimals, payment.get("symbol")
+
+
+def to_event_record(collection, event):
+    raw = json.dumps(event, sort_keys=True)
+    nft = event.get("nft") or event.get("asset") or {}
+    price, symbol = get_price(event)
+    return (
+        collection,
+        hashlib.sha256(raw.encode("utf-8")).hexdigest(),
+        event.get("event_type"),
+        int(event.get("event_timestamp") or 0),
+        event.get("transaction"),
+        (nft.get("contract") or "").lower() or None,
+        nft.get("identifier"),
+        (event.get("seller") or event.get("from_address") or event.get("maker") or "").lower(),
+        (event.get("buyer") or event.get("to_address") or event.get("taker") or "").lower(),
+        int(event.get("quantity") or 1),
+        price,
+        symbol,
+        raw,
+    )
+
+
+def replace_holdings(address, nfts, next_cursor=None):
+    address = address.lower()
+    connection = get_connection()
+    with connection:
+        connection.execute("DELETE FROM holdings WHERE address = ?", (address,))
+        connection.executemany(
+            "INSERT OR REPLACE INTO holdings VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    address,
+                    (nft.get("contract") or "").lower(),
+                    str(nft.get("identifier")),
+                    nft.get("collection"),
+                    nft.get("name"),
+                    nft.get("token_standard"),
+                    json.dumps(nft),
+                )
+                for nft in nfts
+            ],
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO holding_syncs VALUES (?, ?, ?)",
+            (address, time.time(), next_cursor),
+        )
+
+
+def get_holding_sync(address):
+    row = (
+        get_connection()
+        .execute(
+            "SELECT synced_at, next_cursor FROM holding_syncs WHERE address = ?",
+            (address.lower(),),
+        )
+        .fetchone()
+    )
+    return tuple(row) if row else None
+
+
+def insert_events(collection, events):
+    connection = get_connection()
+    with connection:
+        connection.executemany(
+            f"INSERT OR IGNORE INTO events VALUES ({', '.join('?' * 13)})",
+            [to_event_record(collection, event) for event in events],
+        )
+
+
+def get_event_sync(collection):
+    row = (
+        get_connection()
+        .execute(
+            "SELECT covered_from, last_timestamp, synced_at FROM event_syncs "
+            "WHERE collection = ?",
+            (collection,),
+        )
+        .fetchone()
+    )
+    return tuple(row) if row else None
+
+
+def set_event_sync(collection, covered_from, last_timestamp, synced_at):
+    connection = get_connection()
+    with connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO event_syncs VALUES (?, ?, ?, ?)",
+            (collection, covered_from, last_timestamp, synced_at),
+        )
+
+
+async def sync_holdings(address):
+    """
+    Walk every page of the address's NFTs into the snapshot unless it is fresh,
+    and return whether the snapshot holds all of them; the page limit can cut
+    the walk short. The walk replaces the old holdings in one go, there is no
+    cursor to resume from since OpenSea lists holdings without timestamps.
+    """
+    async with get_sync_lock(("holdings", address.lower())):
+        state = await asyncio.to_thread(get_holding_sync, address)
+        if state is not None and is_fresh(state[0]):
+            return state[1] is None
+        nfts, cursor = [], None
+        async for page, cursor in iter_pages(
+            f"/chain/ethereum/account/{address}/nfts",
+            {"limit": HOLDINGS_PAGE_SIZE},
+            "nfts",
+        ):
+            nfts.extend(page)
+        # a cursor left over means the page limit stopped the walk
+        await asyncio.to_thread(replace_holdings, address, nfts, cursor)
+        return cursor is None
+
+
+async def walk_events(collection, after, before=None):
+    """
+    Store the collection's events between `after` and `before`, newest first,
+    each page written while the next downloads. Returns the start of the
+    stored stretch, `after` unless the page limit cut the walk short, and the
+    newest event's timestamp.
+    """
+    params = {"after": int(after), "limit": EVENTS_PAGE_SIZE}
+    if before is not None:
+        params["before"] = int(before)
+    timestamps, cursor = [], None
+    async for events, cursor in iter_pages(
+        f"/events/collection/{collection}", params, "asset_events"
+    ):
+        timestamps += [int(event.get("event_timestamp") or 0) for event in events]
+        await asyncio.to_thread(insert_events, collection, events)
+    newest = max(timestamps, default=None)
+    # a cursor left over means the page limit stopped the walk
+    return (min(timestamps) if cursor and timestamps else int(after)), newest
+
+
+async def sync_events(collection, since):
+    """
+    Make the snapshot hold the collection's events from `since` until now and
+    return the time it covers from, later than `since` if the page limit was
+    hit. New events are fetched with `after` set to the newest stored one once
+    the snapshot is stale; a window older than the snapshot is backfilled.
+    """
+    since = int(since)
+    async with get_sync_lock(("events", collection)):
+        state = await asyncio.to_thread(get_event_sync, collection)
+        now = time.time()
+        if state is None:
+            covered_from, last_timestamp = await walk_events(collection, since)
+            await asyncio.to_thread(
+                set_event_sync, collection, covered_from, last_timestamp, now
+            )
+            return covered_from
+
+        covered_from, last_timestamp, synced_at = state
+        if not is_fresh(synced_at):
+            start = last_timestamp or covered_from
+            new_start, newest = await walk_events(collection, start)
+            if new_start > start:
+                # too many new events to walk, the stretch before them is missing
+                covered_from = new_start
+            last_timestamp = max(last_timestamp or 0, newest or 0) or None
+            synced_at = now
+        if since < covered_from:
+            covered_from, _ = await walk_events(collection, since, before=covered_from)
+        await asyncio.to_thread(
+            set_event_sync, collection, covered_from, last_timestamp, synced_at
+        )
+        return covered_from
+
+
+def get_default_since():
+    return time.time() - NFT_EVENTS_DAYS * 86400
+
+
+def get_holdings(address):
+    rows = get_connection().execute(
+        "SELECT raw FROM holdings WHERE address = ? ORDER BY collection, identifier",
+        (address.lower(),),
+    )
+    return [json.loads(row["raw"]) for row in rows]
+
+
+def count_holdings(address):
+    """Holdings per collection, largest first."""
+    query = """
+        SELECT collection, COUNT(*) AS count FROM holdings WHERE address = ?
+        GROUP BY collection ORDER BY count DESC
+    """
+    return [dict(row) for row in get_connection().execute(query, (address.lower(),))]
+
+
+def list_events(collection, after=None, before=None, event_type="all", limit=50):
+    """Stored raw events, newest first."""
+    clauses, params = ["collection = :collection"], {"collection": collection}
+    if after is not None:
+        clauses.append("event_timestamp >= :after")
+        params["after"] = int(after)
+    if before is not None:
+        clauses.append("event_timestamp < :before")
+        params["before"] = int(before)
+    if event_type and event_type != "all":
+        # listings and offers come back as "order" events with an order_type
+        clauses.append(
+            "(event_type = :event_type OR json_extract(raw, '$.order_type') = :event_type)"
+        )
+        params["event_type"] = event_type
+    params["limit"] = limit
+    query = f"""
+        SELECT raw FROM events WHERE {' AND '.join(clauses)}
+        ORDER BY event_timestamp DESC LIMIT :limit
+    """
+    return [json.loads(row["raw"]) for row in get_connection().execute(query, params)]
+
+
+def sales_volume(collection, since, group_by="none"):
+    """Sale count, volume and price range per payment token, per day if asked."""
+    group = "strftime('%Y-%m-%d', event_timestamp, 'unixepoch')" if group_by == "day" else "'all'"
+    query = f"""
+        SELECT {group} AS grp, symbol,
+               COUNT(*) AS sales,
+               SUM(price) AS volume,
+               AVG(price) AS average_price,
+               MIN(price) AS min_price,
+               MAX(price) AS max_price,
+               COUNT(DISTINCT buyer) AS buyers
+        FROM events
+        WHERE collection = ? AND event_type = 'sale' AND event_timestamp >= ?
+        GROUP BY grp, symbol ORDER BY grp, volume DESC
+    """
+    return [dict(row) for row in get_connection().execute(query, (collection, int(since)))]
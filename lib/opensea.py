@@ -0,0 +1,48 @@
+import os
+import asyncio
+
+from lib.client import client
+from lib.constants import NFT_MAX_PAGES, OPENSEA_API_URL
+
+opensea_headers = {"accept": "application/json"}
+# httpx rejects a None header value, without a key the header is left out
+if os.getenv("OPENSEA_API_KEY"):
+    opensea_headers["x-api-key"] = os.getenv("OPENSEA_API_KEY")
+
+
+async def opensea_get(path, params=None):
+    response = await client.aget(
+        f"{OPENSEA_API_URL}{path}", headers=opensea_headers, params=params
+    )
+    return response.json()
+
+
+async def iter_pages(path, params, key, max_pages=NFT_MAX_PAGES):
+    """
+    Yield the `key` list of each page of a cursor-paginated OpenSea endpoint
+    with the cursor to the next page, None on the last. After `max_pages`
+    pages the walk stops with the cursor still set. The next page is requested
+    as soon as its cursor is known, so it downloads while the caller handles
+    the current one. Raises ValueError on an OpenSea error payload.
+    """
+    request = asyncio.create_task(opensea_get(path, params))
+    for page in range(max_pages):
+        payload = await request
+        if not isinstance(payload, dict) or "errors" in payload:
+            raise ValueError(f"OpenSea error: {payload}")
+        items = payload.get(key) or []
+        # an empty page ends the walk even if it carries a cursor
+        cursor = payload.get("next") if items else None
+        request = None
+        if cursor and page + 1 < max_pages:
+            request = asyncio.create_task(
+                opensea_get(path, {**params, "next": cursor})
+            )
+        try:
+            yield items, cursor or None
+        except BaseException:
+            if request:
+                request.cancel()
+            raise
+        if request is None:
+            return
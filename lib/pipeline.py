@@ -0,0 +1,414 @@
+import time
+import functools
+import threading
+from typing import Callable, Optional
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from pydantic import PrivateAttr
+from langchain_core.documents import Document
+from rich.table import Table
+from langchain_core.retrievers import BaseRetriever
+
+from lib import tracing, txstore
+from lib.hybrid import HybridRetriever, LexicalIndex, fuse, hybrid_search
+from lib.etherscan import get_balance_document, to_document
+from lib.knowledge import load_index
+from lib.store import (
+    get_doc_id,
+    get_last_block,
+    get_vectorstore,
+    get_vectorstore_memory,
+    release_vectorstore,
+    sync_vectorstore,
+)
+from lib.constants import (
+    EMBED_WORKERS,
+    ETHERSCAN_MAX_CONCURRENCY,
+    WALLET_INDEX,
+    WALLET_MEMORY_BUDGET,
+)
+from lib.utils import console
+
+
+class StageTimer:
+    def __init__(self):
+        self.records = {}
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def track(self, stage, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                key = (stage, name)
+                self.records[key] = self.records.get(key, 0.0) + elapsed
+
+    def report(self):
+        table = Table(title="Startup Timing")
+        table.add_column("Stage")
+        table.add_column("Name")
+        table.add_column("Seconds", justify="right")
+        for (stage, name), elapsed in sorted(self.records.items()):
+            table.add_row(stage, name, f"{elapsed:.2f}")
+        totals = {}
+        for (stage, _), elapsed in self.records.items():
+            totals[stage] = totals.get(stage, 0.0) + elapsed
+        for stage, elapsed in sorted(totals.items()):
+            table.add_row(f"[bold]{stage}[/bold]", "sum", f"{elapsed:.2f}")
+        table.add_row(
+            "[bold]wall[/bold]", "", f"{time.perf_counter() - self.started:.2f}"
+        )
+        console.print(table)
+
+
+timer = StageTimer()
+fetch_slots = threading.BoundedSemaphore(ETHERSCAN_MAX_CONCURRENCY)
+embed_slots = threading.BoundedSemaphore(EMBED_WORKERS)
+
+
+class LazyRetriever(BaseRetriever):
+    """Retriever whose documents are fetched and indexed on first use."""
+
+    name: str
+    build: Callable[[], BaseRetriever]
+
+    _retriever: Optional[BaseRetriever] = PrivateAttr(default=None)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def is_built(self):
+        return self._retriever is not None
+
+    def get_retriever(self):
+        if self._retriever is None:
+            with self._lock:
+                if self._retriever is None:
+                    self._retriever = self.build()
+        return self._retriever
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return self.get_retriever().invoke(
+            query, config={"callbacks": run_manager.get_child()}
+        )
+
+
+def index_filter(filter, address):
+    """
+    Index `filter` history into the address's wallet store batch by batch, so
+    memory stays bounded by one page plus one batch. Rows already in the
+    transaction store past the index checkpoint are embedded first, then new
+    rows stream in from Etherscan.
+    """
+    if filter == "eth_balance":
+        with fetch_slots, timer.track("fetch", filter):
+            docs = [get_balance_document(address)]
+        with embed_slots, timer.track("embed", filter):
+            sync_vectorstore(docs, WALLET_INDEX, address, scope=filter)
+        return
+
+    def index(batch):
+        docs = [to_document(item, filter, address) for item in batch]
+        with embed_slots, timer.track("embed", filter):
+            # checkpoints the batch's last block in the store manifest
+            sync_vectorstore(docs, WALLET_INDEX, address, scope=filter)
+
+    def index_stored():
+        start_block = get_last_block(WALLET_INDEX, address, scope=filter)
+        for batch in txstore.iter_stored_batches(address, filter, start_block):
+            index(batch)
+
+    index_stored()
+    batches = txstore.sync_transactions(filter, address)
+    while True:
+        with fetch_slots, timer.track("fetch", filter):
+            batch = next(batches, None)
+        if batch is None:
+            break
+        index(batch)
+    # rows stored by a concurrent sync of the same filter we waited on
+    index_stored()
+
+
+def build_where(
+    transaction_type=None,
+    token=None,
+    counterparty=None,
+    start_block=None,
+    end_block=None,
+):
+    """Chroma metadata filter for a wallet search, None when unfiltered."""
+    clauses = []
+    if transaction_type:
+        clauses.append({"transaction_type": transaction_type})
+    if token:
+        clauses.append({"token": token.upper()})
+    if counterparty:
+        clauses.append({"counterparty": counterparty.lower()})
+    if start_block is not None:
+        clauses.append({"block_number": {"$gte": start_block}})
+    if end_block is not None:
+        clauses.append({"block_number": {"$lte": end_block}})
+    if len(clauses) > 1:
+        return {"$and": clauses}
+    return clauses[0] if clauses else None
+
+
+def matches(
+    metadata,
+    transaction_type=None,
+    token=None,
+    counterparty=None,
+    start_block=None,
+    end_block=None,
+):
+    """`build_where` as a predicate, for documents ranked outside Chroma."""
+    block = metadata.get("block_number")
+    return (
+        (not transaction_type or metadata.get("transaction_type") == transaction_type)
+        and (not token or metadata.get("token") == token.upper())
+        and (not counterparty or metadata.get("counterparty") == counterparty.lower())
+        and (start_block is None or (block is not None and block >= start_block))
+        and (end_block is None or (block is not None and block <= end_block))
+    )
+
+
+class WalletIndex:
+    """
+    One vector store for every Etherscan filter of an address, with the filter,
+    block, time, token and counterparty of each row as metadata. Each filter is
+    indexed the first time a search needs it, then mirrored into a lexical index
+    for exact identifier lookups and BM25.
+    """
+
+    def __init__(self, address, filters):
+        self.address = address
+        self.filters = list(filters)
+        self.ready = set()
+        self.locks = {filter: threading.Lock() for filter in self.filters}
+        self.lexical = LexicalIndex()
+        # estimated bytes of the vector store, counted once it is opened
+        self.vector_memory = 0
+        # searches in progress, an index in use is never evicted
+        self.searches = 0
+        self.searches_lock = threading.Lock()
+
+    def ensure(self, filters=None):
+        pending = [f for f in filters or self.filters if f not in self.ready]
+        if len(pending) == 1:
+            self.index(pending[0])
+        elif pending:
+            with ThreadPoolExecutor(len(pending)) as pool:
+                list(pool.map(tracing.bind(self.index), pending))
+
+    def index(self, filter):
+        with self.locks[filter]:
+            if filter not in self.ready:
+                with tracing.span(filter, "index", address=self.address):
+                    index_filter(filter, self.address)
+                    self.load(filter)
+                self.ready.add(filter)
+
+    @property
+    def memory(self):
+        return self.lexical.memory + self.vector_memory
+
+    @property
+    def busy(self):
+        return self.searches > 0 or any(
+            lock.locked() for lock in self.locks.values()
+        )
+
+    def load(self, filter):
+        """Replace the lexical index's `filter` documents with the stored ones."""
+        vectorstore = get_vectorstore(WALLET_INDEX, self.address)
+        self.vector_memory = get_vectorstore_memory(WALLET_INDEX, self.address)
+        stored = vectorstore.get(
+            where={"transaction_type": filter}, include=["documents", "metadatas"]
+        )
+        self.lexical.remove(lambda metadata: metadata["transaction_type"] == filter)
+        self.lexical.add(
+            Document(page_content=content, metadata=metadata)
+            for content, metadata in zip(stored["documents"], stored["metadatas"])
+        )
+
+    def append(self, filter, rows):
+        """
+        Add newly stored `filter` rows to the index. Returns False without
+        waiting when the filter isn't built or is being built, the build reads
+        them from the transaction store.
+        """
+        lock = self.locks[filter]
+        if filter not in self.ready or not lock.acquire(blocking=False):
+            return False
+        try:
+            docs = [to_document(item, filter, self.address) for item in rows]
+            with embed_slots:
+                sync_vectorstore(docs, WALLET_INDEX, self.address, scope=filter)
+            self.lexical.add(docs)
+            self.vector_memory = get_vectorstore_memory(WALLET_INDEX, self.address)
+        finally:
+            lock.release()
+        return True
+
+    def refresh_balance(self):
+        """Replace the indexed balance with the current one if it was built."""
+        lock = self.locks["eth_balance"]
+        if "eth_balance" not in self.ready or not lock.acquire(blocking=False):
+            return False
+        try:
+            docs = [get_balance_document(self.address)]
+            with embed_slots:
+                sync_vectorstore(docs, WALLET_INDEX, self.address, scope="eth_balance")
+            self.load("eth_balance")
+        finally:
+            lock.release()
+        return True
+
+    def hold(self):
+        """Keep the index from being evicted until `release`."""
+        with self.searches_lock:
+            self.searches += 1
+
+    def release(self):
+        with self.searches_lock:
+            self.searches -= 1
+
+    def search(self, query, k=4, transaction_type=None, **filters):
+        self.hold()
+        try:
+            self.ensure([transaction_type] if transaction_type else None)
+            where = build_where(transaction_type, **filters)
+            vectorstore = get_vectorstore(WALLET_INDEX, self.address)
+            return hybrid_search(
+                query,
+                self.lexical,
+                lambda n: vectorstore.similarity_search(query, k=n, filter=where),
+                k,
+                functools.partial(
+                    matches, transaction_type=transaction_type, **filters
+                ),
+            )
+        finally:
+            self.release()
+
+
+# most recently used last
+wallet_indexes = OrderedDict()
+wallet_indexes_lock = threading.Lock()
+
+
+def get_wallet_index(address, filters, hold=False):
+    """
+    The address's wallet index, opened on first use, held against eviction
+    if `hold` until its `release`. Least recently used indexes are closed
+    while the open ones hold more than WALLET_MEMORY_BUDGET bytes; their data
+    stays on disk and reopening only catches up new rows.
+    """
+    key = address.lower()
+    with wallet_indexes_lock:
+        if key not in wallet_indexes:
+            wallet_indexes[key] = WalletIndex(address, filters)
+        wallet_indexes.move_to_end(key)
+        wallet_index = wallet_indexes[key]
+        if hold:
+            wallet_index.hold()
+        evict_wallet_indexes(keep=key)
+    return wallet_index
+
+
+def get_open_wallet_index(address):
+    """The address's wallet index if it is open, without opening it or counting as a use."""
+    with wallet_indexes_lock:
+        return wallet_indexes.get(address.lower())
+
+
+def evict_wallet_indexes(keep=None):
+    total = sum(index.memory for index in wallet_indexes.values())
+    for key in list(wallet_indexes):
+        if total <= WALLET_MEMORY_BUDGET:
+            return
+        index = wallet_indexes[key]
+        # indexes being built are left alone, they are evicted on a later call
+        if key == keep or index.busy:
+            continue
+        del wallet_indexes[key]
+        total -= index.memory
+        release_vectorstore(WALLET_INDEX, index.address)
+
+
+def search_wallets(addresses, filters, query, k=4, **kwargs):
+    """
+    Search several wallets' indexes at once and fuse the rankings. Returns
+    (addresses, document) pairs; a row shared by several wallets, such as a
+    transfer between two of them, comes back once with all of them.
+    """
+    # each index is held as it opens, so opening the next can't evict it
+    indexes = []
+    try:
+        for address in addresses:
+            indexes.append(get_wallet_index(address, filters, hold=True))
+        if len(indexes) == 1:
+            results = [indexes[0].search(query, k=k, **kwargs)]
+        else:
+            with ThreadPoolExecutor(len(indexes)) as pool:
+                search = tracing.bind(lambda index: index.search(query, k=k, **kwargs))
+                results = list(pool.map(search, indexes))
+    finally:
+        for index in indexes:
+            index.release()
+        # what the held indexes kept over the budget is closed now
+        with wallet_indexes_lock:
+            evict_wallet_indexes()
+
+    owners = {}
+    rankings = []
+    for address, docs in zip(addresses, results):
+        ranking = [(get_doc_id(doc), doc) for doc in docs]
+        for doc_id, _ in ranking:
+            owners.setdefault(doc_id, []).append(address)
+        rankings.append(ranking)
+    return [(owners[get_doc_id(doc)], doc) for doc in fuse(rankings, k)]
+
+
+def build_whitepaper_retriever():
+    with timer.track("load", "knowledge"):
+        index = load_index()
+        lexical = LexicalIndex()
+        lexical.add(index.docs)
+    return HybridRetriever(vectorstore=index, lexical=lexical, blocks=False)
+
+
+def get_whitepaper_retriever():
+    """The whitepaper and knowledge base retriever, loaded from its prebuilt index on first use."""
+    return LazyRetriever(name="whitepaper", build=build_whitepaper_retriever)
+
+
+def prewarm(tasks, names):
+    """
+    Run the named warm-up tasks on background daemon threads. Fetches and embeds
+    still share the Etherscan rate limit and the bounded fetch and embed slots.
+    """
+
+    def warm(task):
+        try:
+            task()
+        except Exception:
+            # left unbuilt, the first tool call retries and surfaces the error
+            pass
+
+    threads = []
+    for name in names:
+        if name not in tasks:
+            continue
+        thread = threading.Thread(
+            target=warm, args=(tasks[name],), name=f"prewarm-{name}", daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+    return threads
@@ -0,0 +1,105 @@
+import os
+import sys
+import subprocess
+import tempfile
+
+# kept free of heavy imports, agent.py checks for the flag before its own
+PROFILE_FLAG = "--profile-imports"
+PROFILE_ENV = "IMPORT_PROFILE"
+READY_MARKER = "import time: ready"
+PREFIX = "import time:"
+TOP = 15
+
+
+def is_profiling():
+    return PROFILE_ENV in os.environ
+
+
+def run_profiled(argv):
+    """
+    Run this command again under `-X importtime` with its stderr sent to a log,
+    which it reports from once ready for the first question. Imports made
+    after that, on first use of a tool, are reported when it exits. Returns
+    its exit code.
+    """
+    fd, path = tempfile.mkstemp(prefix="importtime-", suffix=".log")
+    try:
+        with os.fdopen(fd, "w") as log:
+            code = subprocess.call(
+                [sys.executable, "-X", "importtime", *argv],
+                stderr=log,
+                env={**os.environ, PROFILE_ENV: path},
+            )
+        with open(path) as log:
+            lines = log.read().splitlines()
+    finally:
+        os.remove(path)
+
+    # whatever else the run wrote to stderr, warnings and tracebacks
+    for line in lines:
+        if not line.startswith(PREFIX):
+            print(line, file=sys.stderr)
+    if READY_MARKER in lines:
+        deferred = lines[lines.index(READY_MARKER) + 1 :]
+        report(parse(deferred), "Imports after startup")
+    return code
+
+
+def parse(lines):
+    """(module, self µs, cumulative µs, depth) per `-X importtime` line."""
+    rows = []
+    for line in lines:
+        if not line.startswith(PREFIX) or line == READY_MARKER:
+            continue
+        fields = line[len(PREFIX) :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        module = name.lstrip()
+        rows.append(
+            (module, int(fields[0]), int(fields[1]), (len(name) - len(module) - 1) // 2)
+        )
+    return rows
+
+
+def mark_ready():
+    """In a profiled run, report the imports made so far: the cost of startup."""
+    if not is_profiling():
+        return
+    sys.stderr.write(f"{READY_MARKER}\n")
+    sys.stderr.flush()
+    with open(os.environ[PROFILE_ENV]) as log:
+        report(parse(log.read().splitlines()), "Imports at startup")
+
+
+def report(rows, title):
+    from rich.table import Table
+    from lib.utils import console
+
+    if not rows:
+        console.print(f"{title}: none")
+        return
+    packages = {}
+    for module, self_us, _, _ in rows:
+        package = module.split(".")[0]
+        count, total = packages.get(package, (0, 0))
+        packages[package] = (count + 1, total + self_us)
+    total = sum(self_us for _, self_us, _, _ in rows)
+
+    table = Table(title=f"{title}: {total / 1e6:.2f}s in {len(rows)} modules")
+    table.add_column("Package")
+    table.add_column("Modules", justify="right")
+    table.add_column("ms", justify="right")
+    table.add_column("Share", justify="right")
+    for package, (count, package_us) in sorted(packages.items(), key=lambda item: -item[1][1])[:TOP]:
+        table.add_row(package, str(count), f"{package_us / 1000:.0f}", f"{package_us / total:.0%}")
+    console.print(table)
+
+    # the imports our own code triggered directly, with everything they pulled in
+    table = Table(title="Slowest top-level imports")
+    table.add_column("Module")
+    table.add_column("Cumulative ms", justify="right")
+    roots = sorted((row for row in rows if row[3] == 0 and row[2] >= 1000), key=lambda row: -row[2])
+    for module, _, cumulative_us, _ in roots[:TOP]:
+        table.add_row(module, f"{cumulative_us / 1000:.0f}")
+    console.print(table)
@@ -0,0 +1,259 @@
+import json
+import uuid
+import inspect
+import threading
+import functools
+from contextvars import ContextVar
+from collections import OrderedDict
+
+from lib.constants import RESULT_STORE_SIZE, TOOL_OUTPUT_TOKEN_BUDGET
+
+# full payloads of truncated tool outputs by (owner, result_id), most recent
+# last; a payload is only paged by the address and thread that stored it
+results = OrderedDict()
+results_lock = threading.Lock()
+# (address, thread id) of the current run, set by the runner
+current_owner = ContextVar("current_owner", default=None)
+
+
+def pick(item, keys):
+    return {
+        key: item[key] for key in keys if item.get(key) not in (None, "", [], {})
+    }
+
+
+def project_nft(nft):
+    projected = pick(
+        nft,
+        ["identifier", "collection", "contract", "token_standard", "name"],
+    )
+    if nft.get("description"):
+        projected["description"] = nft["description"][:280]
+    if nft.get("owners"):
+        projected["owners"] = nft["owners"][:5]
+    if nft.get("rarity"):
+        projected["rarity_rank"] = nft["rarity"].get("rank")
+    if nft.get("traits"):
+        projected["traits"] = {
+            trait["trait_type"]: trait["value"] for trait in nft["traits"]
+        }
+    return projected
+
+
+def project_event(event):
+    projected = pick(
+        event,
+        [
+            "event_type",
+            "event_timestamp",
+            "transaction",
+            "quantity",
+            "from_address",
+            "to_address",
+            "seller",
+            "buyer",
+            "maker",
+            "taker",
+        ],
+    )
+    payment = event.get("payment")
+    if payment:
+        decimals = int(payment.get("decimals") or 0)
+        amount = int(payment.get("quantity") or 0) / 10**decimals
+        projected["price"] = f"{amount:g} {payment.get('symbol', '')}".strip()
+    nft = event.get("nft") or event.get("asset")
+    if nft:
+        projected["nft"] = pick(nft, ["identifier", "collection", "name"])
+    return projected
+
+
+def project_events(payload):
+    return {
+        "asset_events": [project_event(e) for e in payload.get("asset_events", [])],
+        "next": payload.get("next"),
+    }
+
+
+def project_collection(payload):
+    projected = pick(
+        payload,
+        [
+            "collection",
+            "name",
+            "category",
+            "owner",
+            "total_supply",
+            "created_date",
+            "opensea_url",
+            "project_url",
+            "twitter_username",
+        ],
+    )
+    if payload.get("description"):
+        projected["description"] = payload["description"][:280]
+    if payload.get("contracts"):
+        projected["contracts"] = payload["contracts"]
+    return projected
+
+
+def project_traits(payload):
+    # trait values can run into the thousands, keep the most common of each
+    counts = payload.get("counts") or {}
+    return {
+        "categories": payload.get("categories"),
+        "counts": {
+            trait: dict(sorted(values.items(), key=lambda kv: -kv[1])[:10])
+            for trait, values in counts.items()
+            if isinstance(values, dict)
+        },
+    }
+
+
+PROJECTIONS = {
+    "get_nft_details": lambda payload: project_nft(payload.get("nft") or payload),
+    "get_nft_collection_details": project_collection,
+    "get_nft_collection_stats": lambda payload: {
+        "total": payload.get("total"),
+        "intervals": payload.get("intervals"),
+    },
+    "get_nft_events": project_events,
+    "get_nft_collection_events": lambda payload: {
+        **project_events(payload),
+        "covered_from": payload.get("covered_from"),
+    },
+    "get_nft_collection_traits": project_traits,
+    "get_personal_nft_collection": lambda payload: {
+        "nfts": [
+            pick(nft, ["wallet", "identifier", "collection", "contract", "name"])
+            for nft in payload.get("nfts", [])
+        ],
+        "total": payload.get("total"),
+        **pick(payload, ["complete", "note"]),
+    },
+}
+
+
+def count_tokens(value):
+    # roughly four characters per token for JSON, close enough for a budget
+    return len(json.dumps(value, default=str)) // 4
+
+
+def store_result(payload):
+    result_id = uuid.uuid4().hex[:8]
+    with results_lock:
+        results[(current_owner.get(), result_id)] = payload
+        while len(results) > RESULT_STORE_SIZE:
+            results.popitem(last=False)
+    return result_id
+
+
+def fit_to_budget(projected, payload, budget=TOOL_OUTPUT_TOKEN_BUDGET):
+    """
+    Trim the largest list in `projected` until it fits in `budget` tokens. The
+    full payload is kept in the result store and the output says how to page
+    through it.
+    """
+    if count_tokens(projected) <= budget or not isinstance(projected, dict):
+        return projected
+
+    lists = [key for key, value in projected.items() if isinstance(value, list)]
+    if not lists:
+        return {
+            "preview": json.dumps(projected, default=str)[: budget * 4],
+            "truncated": {
+                "result_id": store_result(payload),
+                "note": "Call get_stored_result with this result_id for the rest.",
+            },
+        }
+
+    key = max(lists, key=lambda k: count_tokens(projected[k]))
+    items = projected[key]
+    rest = {k: v for k, v in projected.items() if k != key}
+    # leave room for the truncation notice
+    shown = fit_items(items, budget - count_tokens(rest) - 64)
+    return {
+        **rest,
+        key: items[:shown],
+        "truncated": {
+            "result_id": store_result(payload),
+            "list": key,
+            "shown": shown,
+            "total": len(items),
+            "note": "Call get_stored_result with this result_id for the rest.",
+        },
+    }
+
+
+def fit_items(items, budget):
+    """How many leading items fit in `budget` tokens, by binary search."""
+    low, high = 0, len(items)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(items[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def projected(name):
+    """Replace a tool's raw payload with its projection, cut to the token budget."""
+    projection = PROJECTIONS[name]
+
+    def shape(payload):
+        if not isinstance(payload, dict) or "errors" in payload:
+            return payload
+        return fit_to_budget(projection(payload), payload)
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                return shape(await func(*args, **kwargs))
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                return shape(func(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+def get_page(result_id, list_name=None, page=1, page_size=10):
+    """A page of items from a stored payload's largest (or named) list."""
+    with results_lock:
+        payload = results.get((current_owner.get(), result_id))
+    if payload is None:
+        return f"No stored result {result_id}, it may have expired."
+
+    lists = {k: v for k, v in payload.items() if isinstance(v, list)}
+    if not lists:
+        # no list to page through, page through the serialized payload instead
+        text = json.dumps(payload, default=str)
+        size = TOOL_OUTPUT_TOKEN_BUDGET * 4
+        return {
+            "page": page,
+            "pages": -(-len(text) // size),
+            "text": text[(page - 1) * size : page * size],
+        }
+    if list_name not in lists:
+        list_name = max(lists, key=lambda k: len(lists[k]))
+    items = lists[list_name]
+    start = (page - 1) * page_size
+    items = items[start : start + page_size]
+    shown = fit_items(items, TOOL_OUTPUT_TOKEN_BUDGET)
+    result = {
+        "list": list_name,
+        "page": page,
+        "pages": -(-len(lists[list_name]) // page_size),
+        "items": items[:shown],
+    }
+    if shown < len(items):
+        result["note"] = (
+            f"Only {shown} of {len(items)} items fit, use a smaller page_size."
+        )
+    return result
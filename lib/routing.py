@@ -0,0 +1,142 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from rich.table import Table
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from lib import tracing
+from lib.llm import get_embeddings
+from lib.projection import count_tokens
+from lib.utils import console
+from lib.constants import PINNED_TOOLS, TOOL_SELECTION_TOP_K
+
+
+def get_turn(messages):
+    """The current user question and the tools called since it was asked."""
+    question, used = "", set()
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            question = message.content if isinstance(message.content, str) else ""
+            break
+        if isinstance(message, AIMessage):
+            used |= {call["name"] for call in message.tool_calls}
+    return question, used
+
+
+class ToolSelector:
+    """
+    Picks the tools to bind for a user turn: the `top_k` whose descriptions
+    embed closest to the question, the pinned ones and any already called in
+    the turn, so the model can finish what it started. The descriptions are
+    embedded once; questions hit the embedding cache on the turn's later calls.
+    """
+
+    def __init__(self, tools, top_k=TOOL_SELECTION_TOP_K, pinned=PINNED_TOOLS):
+        self.tools = tools
+        self.top_k = top_k
+        self.pinned = set(pinned)
+        self.schema_tokens = {
+            tool.name: count_tokens(convert_to_openai_tool(tool)) for tool in tools
+        }
+        self.vectors = None
+        self.selections = OrderedDict()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.bound_tools = 0
+        self.bound_tokens = 0
+        self.seconds = 0.0
+
+    def get_vectors(self):
+        with self.lock:
+            if self.vectors is None:
+                vectors = np.array(
+                    get_embeddings().embed_documents(
+                        [
+                            f"{tool.name.replace('_', ' ')}: {tool.description}"
+                            for tool in self.tools
+                        ]
+                    ),
+                    dtype=np.float32,
+                )
+                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                self.vectors = vectors / np.where(norms == 0, 1, norms)
+            return self.vectors
+
+    def rank(self, question):
+        """Tool names by similarity to `question`, memoized for the turn's later calls."""
+        with self.lock:
+            if question in self.selections:
+                self.selections.move_to_end(question)
+                return self.selections[question]
+        vectors = self.get_vectors()
+        vector = np.array(get_embeddings().embed_query(question), dtype=np.float32)
+        scores = vectors @ (vector / (np.linalg.norm(vector) or 1))
+        names = [self.tools[i].name for i in np.argsort(-scores)[: self.top_k]]
+        with self.lock:
+            self.selections[question] = names
+            while len(self.selections) > 256:
+                self.selections.popitem(last=False)
+        return names
+
+    def select(self, question, used=()):
+        start = time.perf_counter()
+        names = self.pinned | set(used)
+        if question:
+            names |= set(self.rank(question))
+        # keep get_tools' order so the bound schema is stable across calls
+        tools = [tool for tool in self.tools if tool.name in names]
+        with self.lock:
+            self.calls += 1
+            self.bound_tools += len(tools)
+            self.bound_tokens += sum(self.schema_tokens[tool.name] for tool in tools)
+            self.seconds += time.perf_counter() - start
+        return tools
+
+    def as_model(self, get_model):
+        """
+        A dynamic model for `create_react_agent` binding each call's selection
+        to the model `get_model` returns. Every tool stays in the tool node,
+        only the schema sent is narrowed.
+        """
+        bound = {}
+
+        async def select_model(state, runtime):
+            question, used = get_turn(state["messages"])
+            with tracing.span("select", "tools") as span:
+                tools = await asyncio.to_thread(self.select, question, used)
+                span.set(
+                    tools=len(tools),
+                    schema_tokens=sum(self.schema_tokens[tool.name] for tool in tools),
+                )
+            key = tuple(tool.name for tool in tools)
+            if key not in bound:
+                bound[key] = get_model().bind_tools(tools)
+            return bound[key]
+
+        return select_model
+
+    def report(self):
+        all_tokens = sum(self.schema_tokens.values())
+        table = Table(title="Tool Selection")
+        for column in [
+            "Model calls",
+            "Tools bound",
+            "Schema tokens",
+            "Saved per call",
+            "Avg select ms",
+        ]:
+            table.add_column(column, justify="right")
+        calls = self.calls or 1
+        bound_tokens = self.bound_tokens / calls
+        table.add_row(
+            str(self.calls),
+            f"{self.bound_tools / calls:.1f} of {len(self.tools)}",
+            f"{bound_tokens:.0f} of {all_tokens}",
+            f"{1 - bound_tokens / all_tokens:.0%}" if self.calls and all_tokens else "-",
+            f"{self.seconds / calls * 1000:.1f}",
+        )
+        console.print(table)
@@ -0,0 +1,161 @@
+import time
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.prebuilt import create_react_agent
+
+from lib import tracing
+from lib.llm import get_llm
+from lib.memory import get_compaction_hook
+from lib.prompt import system_message
+from lib.projection import current_owner
+from lib.tools import current_address, current_wallets
+
+
+def bind_all(tools, get_model):
+    """A dynamic model for `create_react_agent` binding every tool."""
+    bound = []
+
+    def select_model(state, runtime):
+        if not bound:
+            bound.append(get_model().bind_tools(tools))
+        return bound[0]
+
+    return select_model
+
+
+def build_agent(tools, checkpointer, model=None, selector=None):
+    """
+    The agent, binding only `selector`'s picks to each model call if given.
+    Without `model` the chat model is built on the first call, not here.
+    """
+    get_model = (lambda: model) if model else get_llm
+    return create_react_agent(
+        model=selector.as_model(get_model) if selector else bind_all(tools, get_model),
+        tools=tools,
+        checkpointer=checkpointer,
+        prompt=system_message,
+        pre_model_hook=get_compaction_hook(get_model),
+    )
+
+
+def get_config(address, thread_id):
+    # threads belong to one address, a thread id can't reach another wallet's history
+    return {"configurable": {"thread_id": f"{address.lower()}:{thread_id}"}}
+
+
+async def get_previous_question(executor, config):
+    """The thread's last user question, "" for a new thread."""
+    state = await executor.aget_state(config)
+    for message in reversed(state.values.get("messages", [])):
+        if isinstance(message, HumanMessage) and isinstance(message.content, str):
+            return message.content
+    return ""
+
+
+async def answer_from_cache(executor, config, answers, question, wallets, context):
+    """
+    A cached answer to a similar question asked after the same `context`
+    question, recorded in the thread so follow-up questions keep their context.
+    None when there is no fresh one.
+    """
+    with tracing.span("answers", "cache") as span:
+        answer = await asyncio.to_thread(answers.lookup, question, wallets, context)
+        span.set(cache_hits=int(answer is not None), cache_misses=int(answer is None))
+    if answer is None:
+        return None
+    message = AIMessage(content=answer, response_metadata={"model_name": "answer cache"})
+    await executor.aupdate_state(
+        config,
+        {"messages": [HumanMessage(content=question), message]},
+        as_node="agent",
+    )
+    return message
+
+
+async def run_agent(
+    executor,
+    question,
+    address,
+    thread_id,
+    answers=None,
+    renderer=None,
+    wallets=None,
+):
+    """
+    Run one user turn for `address` on `thread_id`, showing it through
+    `renderer` if given. `wallets` are all the user's addresses the wallet
+    tools may span, `address` among them. Returns the answer, the tools used
+    and whether the answer came from the cache, and the trace id when tracing.
+    """
+    wallets = wallets or [address]
+    current_address.set(address)
+    current_wallets.set(wallets)
+    current_owner.set((address.lower(), str(thread_id)))
+    with tracing.trace_turn(
+        "turn", address=address, thread_id=str(thread_id)
+    ) as trace:
+        result = await run_turn(
+            executor, question, address, thread_id, answers, renderer, wallets, trace
+        )
+    if trace is not None:
+        result["trace_id"] = trace.trace_id
+        if renderer:
+            renderer.on_trace(trace)
+    return result
+
+
+async def run_turn(
+    executor, question, address, thread_id, answers, renderer, wallets, trace
+):
+    start = time.perf_counter()
+    config = get_config(address, thread_id)
+    if trace is not None:
+        config["callbacks"] = [tracing.TraceHandler(trace)]
+
+    context = ""
+    if answers:
+        context = await get_previous_question(executor, config)
+        message = await answer_from_cache(
+            executor, config, answers, question, wallets, context
+        )
+        if message is not None:
+            if renderer:
+                renderer.on_update({"agent": {"messages": [message]}})
+            return {
+                "answer": message.content,
+                "tools": [],
+                "cached": True,
+                "seconds": round(time.perf_counter() - start, 3),
+            }
+
+    answer, tools, failed = None, [], False
+    # tool calls from one model step are awaited together by the tool node
+    async for mode, chunk in executor.astream(
+        {"messages": [HumanMessage(content=question)]},
+        config=config,
+        stream_mode=["messages", "updates"],
+    ):
+        if mode == "messages":
+            if renderer:
+                renderer.on_token(*chunk)
+            continue
+        if renderer:
+            renderer.on_update(chunk)
+        for message in chunk.get("agent", {}).get("messages", []):
+            answer = message.content
+        for message in chunk.get("tools", {}).get("messages", []):
+            tools.append(message.name)
+            failed = failed or message.status == "error"
+
+    if answers:
+        # a failed call makes the answer unfit for reuse
+        await asyncio.to_thread(
+            answers.store, question, wallets, answer, None if failed else tools, context
+        )
+    return {
+        "answer": answer,
+        "tools": tools,
+        "cached": False,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
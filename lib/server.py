@@ -0,0 +1,88 @@
+import json
+import asyncio
+
+from aiohttp import web
+
+from lib.runner import run_agent
+from lib.utils import get_random_thread_id, is_address
+
+
+def create_app(executor, answers=None):
+    """
+    POST /chat with {"address", "message", "thread_id"?, "wallets"?} runs one
+    turn and returns the answer as JSON; without a thread_id a new thread is
+    started. `wallets` lists the user's other addresses the wallet tools may
+    search alongside `address`.
+    GET /health reports liveness. Turns on one thread run one at a time, turns
+    on different threads run concurrently.
+    """
+    # a thread's lock and the requests holding or awaiting it, dropped when
+    # the last one is done so idle threads don't pile up
+    thread_locks = {}
+    lock_users = {}
+
+    async def chat(request):
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return web.json_response({"error": "Body must be JSON."}, status=400)
+        if not isinstance(body, dict):
+            return web.json_response({"error": "Body must be a JSON object."}, status=400)
+
+        address = body.get("address")
+        message = body.get("message")
+        if not isinstance(address, str) or not is_address(address):
+            return web.json_response(
+                {"error": "A valid Ethereum address is required."}, status=400
+            )
+        if not isinstance(message, str) or not message:
+            return web.json_response({"error": "A message is required."}, status=400)
+
+        wallets = body.get("wallets") or [address]
+        if not all(isinstance(w, str) and is_address(w) for w in wallets):
+            return web.json_response(
+                {"error": "wallets must be Ethereum addresses."}, status=400
+            )
+        if address.lower() not in [w.lower() for w in wallets]:
+            wallets = [address] + wallets
+        thread_id = str(body.get("thread_id") or get_random_thread_id())
+        key = (address.lower(), thread_id)
+        lock = thread_locks.setdefault(key, asyncio.Lock())
+        lock_users[key] = lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                result = await run_agent(
+                    executor,
+                    message,
+                    address,
+                    thread_id,
+                    answers=answers,
+                    wallets=wallets,
+                )
+        except Exception as e:
+            return web.json_response(
+                {"thread_id": thread_id, "error": str(e)}, status=500
+            )
+        finally:
+            lock_users[key] -= 1
+            if not lock_users[key]:
+                del lock_users[key], thread_locks[key]
+        return web.json_response({"thread_id": thread_id, "address": address, **result})
+
+    async def health(request):
+        return web.json_response({"status": "ok"})
+
+    app = web.Application()
+    app.add_routes([web.post("/chat", chat), web.get("/health", health)])
+    return app
+
+
+async def serve(executor, host, port, answers=None):
+    runner = web.AppRunner(create_app(executor, answers))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Serving on http://{host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,144 @@
+import os
+import re
+import ast
+import json
+import hashlib
+import threading
+
+from lib.llm import embedding_model, get_embeddings
+from lib.constants import VECTORSTORE_DIR, VECTORSTORE_OPEN_BYTES, VECTORSTORE_ROW_BYTES
+
+MANIFEST_FILE = "manifest.json"
+
+manifest_lock = threading.Lock()
+# chromadb can't open one persist directory from several threads at once
+vectorstores = {}
+vectorstores_lock = threading.Lock()
+
+
+def get_store_path(name, address=None):
+    """Directory of the on-disk store for an (address, filter, embedding model) key."""
+    owner = address.lower() if address else "shared"
+    model = re.sub(r"[^a-zA-Z0-9_.-]", "_", embedding_model)
+    return os.path.join(VECTORSTORE_DIR, owner, model, name)
+
+
+def load_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"last_blocks": {}, "count": 0}
+
+
+def save_manifest(path, manifest):
+    os.makedirs(path, exist_ok=True)
+    tmp = os.path.join(path, f"{MANIFEST_FILE}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(path, MANIFEST_FILE))
+
+
+def get_last_block(name, address=None, scope=None):
+    manifest = load_manifest(get_store_path(name, address))
+    return manifest.get("last_blocks", {}).get(scope or "")
+
+
+def get_vectorstore_memory(name, address=None):
+    """Estimated bytes the open store for `name` holds, from its stored row count."""
+    count = load_manifest(get_store_path(name, address)).get("count", 0)
+    dim = get_embeddings().cache.dim or 0
+    return VECTORSTORE_OPEN_BYTES + count * (dim * 4 + VECTORSTORE_ROW_BYTES)
+
+
+def get_doc_id(doc):
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def get_block_number(doc):
+    """Block number of an Etherscan document, parsed from its serialized row."""
+    if "block_number" in doc.metadata:
+        return int(doc.metadata["block_number"])
+    try:
+        item = ast.literal_eval(doc.page_content)
+    except (ValueError, SyntaxError):
+        return None
+    if isinstance(item, dict) and item.get("blockNumber"):
+        return int(item["blockNumber"])
+    return None
+
+
+def get_vectorstore(name, address=None):
+    path = get_store_path(name, address)
+    with vectorstores_lock:
+        if path not in vectorstores:
+            # chromadb is slow to import, it is loaded with the first store
+            from langchain_community.vectorstores import Chroma
+
+            vectorstores[path] = Chroma(
+                collection_name=f"{VECTORSTORE_DIR}_{name}",
+                embedding_function=get_embeddings(),
+                persist_directory=path,
+            )
+        return vectorstores[path]
+
+
+def release_vectorstore(name, address=None):
+    """Drop the cached store for `name`, closing its client where chromadb allows."""
+    with vectorstores_lock:
+        vectorstore = vectorstores.pop(get_store_path(name, address), None)
+    close = getattr(getattr(vectorstore, "_client", None), "close", None)
+    if close is not None:
+        close()
+
+
+def sync_vectorstore(docs, name, address=None, scope=None):
+    """
+    Add documents to the persistent store for `name`, embedding only the ones
+    whose content hash is not stored yet.
+
+    `scope` is the transaction type the documents belong to in a store shared by
+    several types; block checkpoints are kept per scope. Documents without block
+    numbers (balances, whitepaper chunks) are treated as a snapshot of their
+    scope: stored entries of that scope missing from `docs` are removed.
+    Returns the vector store and the number of newly embedded documents.
+    """
+    path = get_store_path(name, address)
+    vectorstore = get_vectorstore(name, address)
+
+    docs_by_id = {}
+    for doc in docs:
+        if doc.page_content:
+            docs_by_id.setdefault(get_doc_id(doc), doc)
+
+    if not docs_by_id:
+        return vectorstore, 0
+
+    ids = list(docs_by_id)
+    existing = set(vectorstore.get(ids=ids, include=[])["ids"])
+    new_ids = [doc_id for doc_id in ids if doc_id not in existing]
+    if new_ids:
+        vectorstore.add_documents(
+            [docs_by_id[doc_id] for doc_id in new_ids], ids=new_ids
+        )
+
+    blocks = [get_block_number(doc) for doc in docs_by_id.values()]
+    blocks = [block for block in blocks if block is not None]
+    if not blocks:
+        where = {"transaction_type": scope} if scope else None
+        stale = set(vectorstore.get(where=where, include=[])["ids"]) - set(ids)
+        if stale:
+            vectorstore.delete(ids=list(stale))
+
+    # scopes of one store sync concurrently, update the manifest under a lock
+    with manifest_lock:
+        manifest = load_manifest(path)
+        last_blocks = manifest.setdefault("last_blocks", {})
+        if blocks:
+            key = scope or ""
+            last_blocks[key] = max(blocks + [last_blocks.get(key) or 0])
+        manifest["count"] = vectorstore._collection.count()
+        manifest["embedding_model"] = embedding_model
+        save_manifest(path, manifest)
+
+    return vectorstore, len(new_ids)
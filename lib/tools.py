@@ -1,15 +1,39 @@
 import os
-import requests
+import asyncio
+import functools
+from functools import partial
+from contextvars import ContextVar
+from datetime import datetime, timezone
 from typing import Annotated, Literal
-from pycoingecko import CoinGeckoAPI
 from dotenv import load_dotenv
 
 from langchain_core.tools import tool
 from langchain_core.tools import create_retriever_tool
-from langchain_community.agent_toolkits.load_tools import load_tools
 
 
-from lib.utils import get_retriever, get_etherscan_docs, get_whitepaper_docs, split_docs
+from lib.cache import cached
+from lib.client import client
+from lib.constants import CACHE_TTLS, HTTP_TIMEOUT, NFT_MAX_PAGES
+from lib.nftstore import (
+    HOLDINGS_PAGE_SIZE,
+    count_holdings,
+    get_default_since,
+    get_holdings,
+    list_events,
+    sales_volume,
+    sync_events,
+    sync_holdings,
+)
+from lib.opensea import opensea_get
+from lib.pipeline import (
+    get_wallet_index,
+    get_whitepaper_retriever,
+    prewarm,
+    search_wallets,
+)
+from lib.projection import get_page, projected
+from lib.txstore import aggregate, ensure_synced, get_tokens, list_transactions
+from lib.utils import is_address, validate_args
 
 load_dotenv()
 
@@ -22,89 +46,238 @@ opts = [
     "normal_transaction",
 ]
 
-cg = CoinGeckoAPI()
+WalletDocType = Literal[
+    "eth_balance",
+    "normal_transaction",
+    "internal_transaction",
+    "erc20_transaction",
+    "erc721_transaction",
+    "erc1155_transaction",
+]
+
+TransactionType = Literal[
+    "normal_transaction",
+    "internal_transaction",
+    "erc20_transaction",
+    "erc721_transaction",
+    "erc1155_transaction",
+]
+
+# address the current request is about, set per run so one process can serve
+# several wallets; the REPL falls back to ACCOUNT_ADDRESS
+current_address = ContextVar("current_address", default=None)
+# every wallet of the user the current request may look at, primary first
+current_wallets = ContextVar("current_wallets", default=None)
+
+
+def get_address():
+    return current_address.get() or os.getenv("ACCOUNT_ADDRESS")
+
+
+def get_wallets(wallet=None):
+    """
+    The addresses a wallet tool call covers: the current one by default, one
+    of the user's wallets by address, or all of them for "all". Raises
+    ValueError for an address that isn't one of the user's wallets.
+    """
+    wallets = current_wallets.get() or [get_address()]
+    if not wallet:
+        return [get_address()]
+    if wallet.lower() == "all":
+        return wallets
+    for address in wallets:
+        if address.lower() == wallet.lower():
+            return [address]
+    raise ValueError(
+        f"{wallet} is not one of the user's wallets: {', '.join(wallets)}"
+    )
+
+
+WalletArg = Annotated[
+    str, "one of the user's wallet addresses, or 'all' for every wallet. Default: the current wallet"
+]
+
+
+@functools.cache
+def get_coingecko():
+    # built on first use, pycoingecko is slow to import
+    from pycoingecko import CoinGeckoAPI
+
+    cg = CoinGeckoAPI()
+    cg.session = client
+    cg.request_timeout = HTTP_TIMEOUT
+    return cg
+
+
+def is_opensea_result(result):
+    return not (isinstance(result, dict) and "errors" in result)
+
+
+def get_historical_price_ttl(coin_name, date):
+    # prices for days that are over never change
+    try:
+        day = datetime.strptime(date, "%d-%m-%Y").date()
+    except ValueError:
+        return CACHE_TTLS["spot_price"]
+    if day < datetime.now(timezone.utc).date():
+        return CACHE_TTLS["historical_price"]
+    return CACHE_TTLS["spot_price"]
 
 
 @tool
+@cached("spot_price", CACHE_TTLS["spot_price"])
 def get_current_coin_price_in_usd(
     coin_name: Annotated[str, "the name of the coin. ie bitcoin, ethereum, monero"]
 ) -> str:
     """Retrieves the current price of a specified cryptocurrency in USD.."""
-    price = cg.get_price(ids=coin_name, vs_currencies="usd")
+    price = get_coingecko().get_price(ids=coin_name, vs_currencies="usd")
     if price is None:
         return f"Could not find the price of {coin_name}."
     return f"The price of {coin_name} is ${price[coin_name]['usd']}."
 
 
 @tool
+@cached("historical_price", get_historical_price_ttl)
 def get_historical_coin_price_in_usd(
     coin_name: Annotated[str, "the name of the coin. ie bitcoin, ethereum, monero"],
     date: Annotated[str, "the date to get the price for. ie DD-MM-YYYY"],
 ) -> str:
     """Retrieves the historical price of a specified cryptocurrency in USD for a given date."""
-    price = cg.get_coin_history_by_id(id=coin_name, date=date)
+    price = get_coingecko().get_coin_history_by_id(id=coin_name, date=date)
     if price is None:
         return f"Could not find the price of {coin_name}."
     return f"The price of {coin_name} on {date} was ${price['market_data']['current_price']['usd']}."
 
 
+@cached("coin_ids", CACHE_TTLS["coin_ids"])
+def get_ethereum_coin_ids():
+    """Maps Ethereum contract addresses to CoinGecko coin ids."""
+    coins = get_coingecko().get_coins_list(include_platform=True)
+    return {
+        coin["platforms"]["ethereum"].lower(): coin["id"]
+        for coin in coins
+        if (coin.get("platforms") or {}).get("ethereum")
+    }
+
+
+def resolve_coins(coins):
+    """
+    Turns coin ids, ERC-20 contract addresses and "wallet" (every token in the
+    user's ERC-20 history) into (label, coin id) pairs, plus labels that have
+    no CoinGecko id.
+    """
+    entries = []
+    for coin in coins:
+        if coin.lower() == "wallet":
+            address = get_address()
+            ensure_synced("erc20_transaction", address)
+            for token in get_tokens(address):
+                contract = token["contract_address"]
+                entries.append((f"{token['token_symbol']} ({contract})", contract))
+        else:
+            entries.append((coin, coin.lower()))
+
+    contract_ids = None
+    resolved, unresolved = [], []
+    for label, coin in entries:
+        if is_address(coin):
+            contract_ids = contract_ids or get_ethereum_coin_ids()
+            coin = contract_ids.get(coin)
+            if coin is None:
+                unresolved.append(label)
+                continue
+        resolved.append((label, coin))
+    return resolved, unresolved
+
+
+@cached("spot_price", CACHE_TTLS["spot_price"])
+def get_prices(ids, vs_currencies):
+    return get_coingecko().get_price(ids=ids, vs_currencies=vs_currencies)
+
+
+@tool
+def get_coin_prices(
+    coins: Annotated[
+        list[str],
+        "coin ids (ie bitcoin, ethereum), ERC-20 contract addresses, or 'wallet' for every token the user has held",
+    ],
+    vs_currencies: Annotated[list[str], "quote currencies. ie usd, eur, btc"] = None,
+) -> str:
+    """Retrieves current prices of many cryptocurrencies in one or more currencies with a single request. Prefer this over repeated single-coin price lookups."""
+    vs_currencies = [currency.lower() for currency in vs_currencies or ["usd"]]
+    resolved, unresolved = resolve_coins(coins)
+
+    prices = {}
+    if resolved:
+        ids = sorted({coin for _, coin in resolved})
+        prices = get_prices(ids, vs_currencies)
+
+    lines = [" | ".join(["coin"] + vs_currencies)]
+    for label, coin in resolved:
+        quote = prices.get(coin)
+        if quote is None:
+            unresolved.append(label)
+            continue
+        values = [
+            f"{quote[currency]:,}" if currency in quote else "-"
+            for currency in vs_currencies
+        ]
+        lines.append(" | ".join([label] + values))
+    if unresolved:
+        lines.append(f"No price found for: {', '.join(unresolved)}")
+    return "\n".join(lines)
+
+
 @tool
+@cached("trending", CACHE_TTLS["trending"])
 def get_trending_coins(
     limit: Annotated[int, "the number of trending coins to retrieve. Default: 5"] = 5,
 ) -> str:
     """Retrieves the top trending coins on CoinGecko."""
-    coins = cg.get_search_trending()
+    coins = get_coingecko().get_search_trending()
     return coins["coins"][:limit]
 
 
 @tool
-def get_nft_details(
+@projected("get_nft_details")
+@cached("nft_metadata", CACHE_TTLS["nft_metadata"], cache_if=is_opensea_result)
+async def get_nft_details(
     contract_address: Annotated[str, "the address of the NFT contract"],
     token_id: Annotated[str, "the ID of the NFT token"],
 ) -> str:
     """Retrieves details of a specific NFT from OpenSea."""
-    url = f"https://api.opensea.io/api/v2/chain/ethereum/contract/{contract_address}/nfts/{token_id}"
-    headers = {
-        "accept": "application/json",
-        "x-api-key": os.getenv("OPENSEA_API_KEY"),
-    }
-
-    response = requests.get(url, headers=headers)
-    return response.json()
+    return await opensea_get(
+        f"/chain/ethereum/contract/{contract_address}/nfts/{token_id}"
+    )
 
 
 @tool
-def get_nft_collection_details(
+@projected("get_nft_collection_details")
+@cached("nft_metadata", CACHE_TTLS["nft_metadata"], cache_if=is_opensea_result)
+async def get_nft_collection_details(
     collection_name: Annotated[str, "the name of the collection"],
 ) -> str:
     """Retrieves details of a specific NFT collection from OpenSea."""
-    url = f"https://api.opensea.io/api/v2/collections/{collection_name}"
-    headers = {
-        "accept": "application/json",
-        "x-api-key": os.getenv("OPENSEA_API_KEY"),
-    }
+    return await opensea_get(f"/collections/{collection_name}")
+
 
-    response = requests.get(url, headers=headers)
-    return response.json()
+@cached("nft_stats", CACHE_TTLS["nft_stats"], cache_if=is_opensea_result)
+async def get_collection_stats(collection_name):
+    return await opensea_get(f"/collections/{collection_name}/stats")
 
 
 @tool
-def get_nft_collection_stats(
+@projected("get_nft_collection_stats")
+async def get_nft_collection_stats(
     collection_name: Annotated[str, "the name of the collection"],
 ) -> str:
     """Retrieves statistics of a specific NFT collection from OpenSea."""
-    url = f"https://api.opensea.io/api/v2/collections/{collection_name}/stats"
-    headers = {
-        "accept": "application/json",
-        "x-api-key": os.getenv("OPENSEA_API_KEY"),
-    }
-
-    response = requests.get(url, headers=headers)
-    return response.json()
+    return await get_collection_stats(collection_name)
 
 
 @tool
-def get_nft_events(
+@projected("get_nft_events")
+async def get_nft_events(
     contract_address: Annotated[str, "the address of the NFT contract"],
     token_id: Annotated[str, "the ID of the NFT token"],
     after: Annotated[
@@ -123,11 +296,6 @@ def get_nft_events(
     ] = 50,
 ) -> str:
     """Retrieves events related to a specific NFT from OpenSea."""
-    url = f"https://api.opensea.io/api/v2/events/chain/ethereum/contract/{contract_address}/nfts/{token_id}"
-    headers = {
-        "accept": "application/json",
-        "x-api-key": os.getenv("OPENSEA_API_KEY"),
-    }
     params = {
         "contract_address": contract_address,
         "token_id": token_id,
@@ -138,12 +306,14 @@ def get_nft_events(
     }
 
     params = {k: v for k, v in params.items() if v is not None}
-    response = requests.get(url, headers=headers, params=params)
-    return response.json()
+    return await opensea_get(
+        f"/events/chain/ethereum/contract/{contract_address}/nfts/{token_id}", params
+    )
 
 
 @tool
-def get_nft_collection_events(
+@projected("get_nft_collection_events")
+async def get_nft_collection_events(
     collection_name: Annotated[str, "the name of the collection"],
     after: Annotated[
         int,
@@ -156,97 +326,293 @@ def get_nft_collection_events(
     event_type: Literal[
         "all", "cancel", "listing", "offer", "order", "redemption", "sale", "transfer"
     ] = "all",
-    limit: Annotated[
-        int, "The number of events to return. Must be between 1 and 50. Default: 50"
-    ] = 50,
+    limit: Annotated[int, "The number of events to return. Default: 50"] = 50,
 ) -> str:
-    """Retrieves events related to a specific NFT collection from OpenSea."""
-    url = f"https://api.opensea.io/api/v2/events/collection/{collection_name}"
-    headers = {
-        "accept": "application/json",
-        "x-api-key": os.getenv("OPENSEA_API_KEY"),
-    }
-    params = {
-        "after": after,
-        "before": before,
-        "event_type": event_type,
-        "limit": limit,
-    }
-
-    params = {k: v for k, v in params.items() if v is not None}
-    response = requests.get(url, headers=headers, params=params)
-    return response.json()
+    """Retrieves events related to a specific NFT collection from OpenSea, newest first. Covers the last 30 days unless `after` reaches further back."""
+    since = after if after is not None else get_default_since()
+    covered_from = await sync_events(collection_name, since)
+    events = await asyncio.to_thread(
+        list_events, collection_name, since, before, event_type, limit
+    )
+    return {"asset_events": events, "covered_from": format_time(covered_from)}
 
 
 @tool
-def get_nft_collection_traits(
+@projected("get_nft_collection_traits")
+@cached("nft_metadata", CACHE_TTLS["nft_metadata"], cache_if=is_opensea_result)
+async def get_nft_collection_traits(
     collection_name: Annotated[str, "the name of the collection"],
 ) -> str:
     """Retrieves traits of a specific NFT collection from OpenSea."""
-    url = f"https://api.opensea.io/api/v2/traits/{collection_name}"
-    headers = {
-        "accept": "application/json",
-        "x-api-key": os.getenv("OPENSEA_API_KEY"),
+    return await opensea_get(f"/traits/{collection_name}")
+
+
+def get_partial_note(addresses, complete):
+    """Flags holdings the page limit cut short, nothing when all were read."""
+    partial = [address for address, done in zip(addresses, complete) if not done]
+    if not partial:
+        return {}
+    return {
+        "complete": False,
+        "note": f"Only the first {NFT_MAX_PAGES * HOLDINGS_PAGE_SIZE} NFTs of "
+        f"{', '.join(partial)} were read, totals for them are partial.",
     }
 
-    response = requests.get(url, headers=headers)
-    return response.json()
+
+@tool
+@projected("get_personal_nft_collection")
+async def get_personal_nft_collection(wallet: WalletArg = None):
+    """Retrieves every NFT in the user's collection from OpenSea."""
+    addresses = get_wallets(wallet)
+    complete = await asyncio.gather(*(sync_holdings(address) for address in addresses))
+    nfts = []
+    for address in addresses:
+        holdings = await asyncio.to_thread(get_holdings, address)
+        if len(addresses) > 1:
+            holdings = [{"wallet": address, **nft} for nft in holdings]
+        nfts.extend(holdings)
+    return {"nfts": nfts, "total": len(nfts), **get_partial_note(addresses, complete)}
+
+
+def get_floor_price(stats):
+    total = stats.get("total") if is_opensea_result(stats) else None
+    if not total or total.get("floor_price") is None:
+        return None, None
+    return total["floor_price"], total.get("floor_price_symbol") or "ETH"
 
 
 @tool
-def get_personal_nft_collection():
-    """Retrieves the NFTs in a user's collection from OpenSea."""
-    url = f"https://api.opensea.io/api/v2/chain/ethereum/account/{os.getenv('ACCOUNT_ADDRESS')}/nfts"
-    headers = {
-        "accept": "application/json",
-        "x-api-key": os.getenv("OPENSEA_API_KEY"),
+async def get_nft_floor_exposure(wallet: WalletArg = None) -> str:
+    """Values the user's NFTs at their collections' floor prices from OpenSea. Returns count, floor price and exposure per collection, largest first, and the total per currency."""
+    addresses = get_wallets(wallet)
+    complete = await asyncio.gather(*(sync_holdings(address) for address in addresses))
+    rows = []
+    for address in addresses:
+        groups = await asyncio.to_thread(count_holdings, address)
+        if len(addresses) > 1:
+            groups = [{"wallet": address, **group} for group in groups]
+        rows.extend(groups)
+
+    collections = sorted({row["collection"] for row in rows if row["collection"]})
+    stats = await asyncio.gather(*(get_collection_stats(c) for c in collections))
+    floors = {c: get_floor_price(s) for c, s in zip(collections, stats)}
+    totals = {}
+    for row in rows:
+        floor, symbol = floors.get(row["collection"], (None, None))
+        row["floor_price"] = floor
+        row["symbol"] = symbol
+        row["exposure"] = None if floor is None else floor * row["count"]
+        if floor is not None:
+            totals[symbol] = totals.get(symbol, 0) + row["exposure"]
+    rows.sort(key=lambda row: -(row["exposure"] or 0))
+    return {
+        "collections": rows,
+        "total_exposure": totals,
+        **get_partial_note(addresses, complete),
     }
 
-    params = {"limit": 200}
 
-    response = requests.get(url, headers=headers, params=params)
-    return response.json()
+@tool
+async def get_nft_sales_volume(
+    collection_name: Annotated[str, "the name of the collection"],
+    days: Annotated[int, "the window, ending now, in days. Default: 7"] = 7,
+    group_by: Literal["none", "day"] = "none",
+) -> str:
+    """Aggregates a collection's OpenSea sales over a recent window: sale count, volume, average, min and max price and distinct buyers per payment token."""
+    since = datetime.now(timezone.utc).timestamp() - days * 86400
+    covered_from = await sync_events(collection_name, since)
+    groups = await asyncio.to_thread(sales_volume, collection_name, since, group_by)
+    result = {"collection": collection_name, "since": format_time(since), "groups": groups}
+    if covered_from > since:
+        # the page limit stopped the walk, older sales are missing
+        result["covered_from"] = format_time(covered_from)
+    return result
 
 
-# TODO: create custom tools to interact w/ smart contracts
-# TODO: create custom tool to send transactions
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+
+
+@tool
+def get_stored_result(
+    result_id: Annotated[str, "the result_id from a truncated tool output"],
+    list_name: Annotated[str, "the list to page through. Default: the largest"] = None,
+    page: Annotated[int, "the page number, starting at 1"] = 1,
+    page_size: Annotated[int, "the number of items per page. Default: 10"] = 10,
+) -> str:
+    """Pages through the full payload of a tool output that was truncated."""
+    return get_page(result_id, list_name, page, page_size)
+
+
+@tool
+def retrieve_wallet_docs(
+    query: Annotated[str, "what to look for in the user's Etherscan history"],
+    transaction_type: Annotated[
+        WalletDocType, "only search this kind of record. Default: all"
+    ] = None,
+    token: Annotated[str, "only transfers of this token symbol. ie USDC"] = None,
+    counterparty: Annotated[str, "only records with this address on the other side"] = None,
+    start_block: Annotated[int, "only records at or after this block"] = None,
+    end_block: Annotated[int, "only records at or before this block"] = None,
+    wallet: WalletArg = None,
+) -> str:
+    """Search and return information from Etherscan about the user's wallet: ETH balance and normal, internal, ERC-20, ERC-721 and ERC-1155 transactions. Tx hashes, addresses and "block N" in the query are looked up exactly. Filters narrow the search before ranking."""
+    addresses = get_wallets(wallet)
+    results = search_wallets(
+        addresses,
+        opts,
+        query,
+        transaction_type=transaction_type,
+        token=token,
+        counterparty=counterparty,
+        start_block=start_block,
+        end_block=end_block,
+    )
+    if len(addresses) == 1:
+        return "\n\n".join(doc.page_content for _, doc in results)
+    return "\n\n".join(
+        f"[{', '.join(owners)}] {doc.page_content}" for owners, doc in results
+    )
 
 
-def get_tools() -> list:
-    docs = [get_etherscan_docs(filter) for filter in opts]
-    print("\n")
-    retrievers = [get_retriever(doc, filter) for filter, doc in zip(opts, docs)]
+@tool
+def aggregate_wallet_transactions(
+    transaction_type: Annotated[
+        TransactionType, "the kind of transactions to aggregate"
+    ],
+    group_by: Literal["none", "token", "counterparty", "day", "month", "year"] = "none",
+    direction: Literal["all", "in", "out"] = "all",
+    token: Annotated[str, "token symbol or contract address. ie USDC"] = None,
+    counterparty: Annotated[str, "address on the other side of the transfers"] = None,
+    start_date: Annotated[str, "include transactions on or after. ie YYYY-MM-DD"] = None,
+    end_date: Annotated[str, "include transactions on or before. ie YYYY-MM-DD"] = None,
+    limit: Annotated[int, "the number of groups to return. Default: 20"] = 20,
+    wallet: WalletArg = None,
+) -> str:
+    """Aggregates the user's full transaction history. Returns count, amount in, amount out (ETH or token units) and gas fees in ETH per group. Use for totals, net flows and gas spent over a period. With several wallets, each group is per wallet."""
+    addresses = get_wallets(wallet)
+    rows = []
+    for address in addresses:
+        ensure_synced(transaction_type, address)
+        groups = aggregate(
+            address,
+            transaction_type,
+            group_by=group_by,
+            limit=limit,
+            direction=direction,
+            token=token,
+            counterparty=counterparty,
+            start_date=start_date,
+            end_date=end_date,
+        )
+        if len(addresses) > 1:
+            groups = [{"wallet": address, **group} for group in groups]
+        rows.extend(groups)
+    return rows
 
-    retriever_tools = [
-        create_retriever_tool(
-            retriever,
-            f"retrieve_etherscan_docs_{filter}",
-            f"Search and return information from Etherscan to answer questions related to {filter.replace('_', ' ')}.",
+
+@tool
+def list_wallet_transactions(
+    transaction_type: Annotated[TransactionType, "the kind of transactions to list"],
+    direction: Literal["all", "in", "out"] = "all",
+    token: Annotated[str, "token symbol or contract address. ie USDC"] = None,
+    counterparty: Annotated[str, "address on the other side of the transfers"] = None,
+    start_date: Annotated[str, "include transactions on or after. ie YYYY-MM-DD"] = None,
+    end_date: Annotated[str, "include transactions on or before. ie YYYY-MM-DD"] = None,
+    limit: Annotated[int, "the number of transactions to return. Default: 20"] = 20,
+    wallet: WalletArg = None,
+) -> str:
+    """Lists the user's transactions matching the filters, newest first. Amounts are in ETH or token units, fees in ETH."""
+    addresses = get_wallets(wallet)
+    rows = []
+    for address in addresses:
+        ensure_synced(transaction_type, address)
+        transactions = list_transactions(
+            address,
+            transaction_type,
+            limit=limit,
+            direction=direction,
+            token=token,
+            counterparty=counterparty,
+            start_date=start_date,
+            end_date=end_date,
         )
-        for filter, retriever in zip(opts, retrievers)
-    ]
+        if len(addresses) > 1:
+            transactions = [{"wallet": address, **row} for row in transactions]
+        rows.extend(transactions)
+    rows.sort(key=lambda row: -row["block_number"])
+    return rows[:limit]
+
+
+# how long an agent answer built on each tool's output may be reused, answers
+# from wallet tools are also dropped as soon as new transactions are stored
+ANSWER_TTLS = {
+    "duckduckgo_search": CACHE_TTLS["search"],
+    "wolfram_alpha": CACHE_TTLS["search"],
+    "retrieve_wallet_docs": CACHE_TTLS["wallet"],
+    "retrieve_whitepaper_docs": None,
+    "aggregate_wallet_transactions": CACHE_TTLS["wallet"],
+    "list_wallet_transactions": CACHE_TTLS["wallet"],
+    "get_current_coin_price_in_usd": CACHE_TTLS["spot_price"],
+    # a day that isn't over yet still has a moving price
+    "get_historical_coin_price_in_usd": CACHE_TTLS["spot_price"],
+    "get_coin_prices": CACHE_TTLS["spot_price"],
+    "get_trending_coins": CACHE_TTLS["trending"],
+    "get_nft_details": CACHE_TTLS["nft_metadata"],
+    "get_nft_events": CACHE_TTLS["nft_stats"],
+    "get_nft_collection_details": CACHE_TTLS["nft_metadata"],
+    "get_nft_collection_stats": CACHE_TTLS["nft_stats"],
+    "get_nft_collection_events": CACHE_TTLS["nft_stats"],
+    "get_nft_collection_traits": CACHE_TTLS["nft_metadata"],
+    "get_personal_nft_collection": CACHE_TTLS["nft_stats"],
+    "get_nft_floor_exposure": CACHE_TTLS["nft_stats"],
+    "get_nft_sales_volume": CACHE_TTLS["nft_stats"],
+    "get_stored_result": None,
+}
+
+
+# TODO: create custom tools to interact w/ smart contracts
+# TODO: create custom tool to send transactions
+
+
+def get_tools(prewarm_tools=None, require_address=True, search_tools=True) -> list:
+    address = os.getenv("ACCOUNT_ADDRESS")
+    validate_args(require_address)
+    whitepaper_retriever = get_whitepaper_retriever()
+    if prewarm_tools:
+        tasks = {"whitepaper": whitepaper_retriever.get_retriever}
+        if address:
+            wallet_index = get_wallet_index(address, opts)
+            for filter in opts:
+                tasks[filter] = partial(wallet_index.ensure, [filter])
+        prewarm(tasks, list(tasks) if "all" in prewarm_tools else prewarm_tools)
 
-    whitepaper_docs = get_whitepaper_docs()
-    whitepaper_docs = split_docs(whitepaper_docs)
-    whitepaper_retriever = get_retriever(whitepaper_docs, "whitepaper")
     whitepaper_retriever_tool = create_retriever_tool(
         whitepaper_retriever,
         "retrieve_whitepaper_docs",
-        "Search and return information from the Ethereum whitepaper.",
+        "Search and return information from the Ethereum whitepaper and the local knowledge base (EIPs, the yellow paper).",
     )
 
-    tools = load_tools(
-        [
-            "ddg-search",
-            "wolfram-alpha",
-        ]
-    )
+    tools = []
+    if search_tools:
+        from langchain_community.agent_toolkits.load_tools import load_tools
 
-    tools.extend(retriever_tools)
+        tools = load_tools(
+            [
+                "ddg-search",
+                "wolfram-alpha",
+            ]
+        )
+
+    tools.append(retrieve_wallet_docs)
     tools.append(whitepaper_retriever_tool)
 
+    tools.append(aggregate_wallet_transactions)
+    tools.append(list_wallet_transactions)
+
     tools.append(get_current_coin_price_in_usd)
     tools.append(get_historical_coin_price_in_usd)
+    tools.append(get_coin_prices)
     tools.append(get_trending_coins)
 
     tools.append(get_nft_details)
@@ -256,5 +622,8 @@ def get_tools() -> list:
     tools.append(get_nft_collection_events)
     tools.append(get_nft_collection_traits)
     tools.append(get_personal_nft_collection)
+    tools.append(get_nft_floor_exposure)
+    tools.append(get_nft_sales_volume)
+    tools.append(get_stored_result)
 
     return tools
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from rich.table import Table
+from langchain_core.callbacks import BaseCallbackHandler
+
+# the turn being traced and the innermost open span; None when tracing is off
+current_trace = ContextVar("current_trace", default=None)
+current_span = ContextVar("current_span", default=None)
+
+export_path = None
+export_lock = threading.Lock()
+
+# attributes summed per row of the turn summary
+TOTALS = ["input_tokens", "output_tokens", "bytes", "texts", "cache_hits", "cache_misses"]
+
+
+def configure(path):
+    """Trace every turn from now on, appending the spans to `path` as JSONL."""
+    global export_path
+    export_path = path
+
+
+def new_id(size):
+    return os.urandom(size).hex()
+
+
+class Span:
+    def __init__(self, trace, name, kind, parent=None, attributes=None):
+        self.trace = trace
+        self.span_id = new_id(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.start = time.perf_counter()
+        self.seconds = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        self.status = "error"
+        self.attributes["error"] = repr(error)
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.start
+        self.trace.add(self)
+
+    def to_dict(self):
+        """The span in the shape of an OpenTelemetry span's JSON export."""
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.start_ns + int(self.seconds * 1e9),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class NoopSpan:
+    def set(self, **attributes):
+        pass
+
+    def fail(self, error):
+        pass
+
+
+noop_span = NoopSpan()
+
+
+class Trace:
+    """The spans of one agent turn, the turn itself being the root span."""
+
+    def __init__(self, name, **attributes):
+        self.trace_id = new_id(16)
+        self.spans = []
+        self.lock = threading.Lock()
+        self.root = Span(self, name, "turn", attributes=attributes)
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+    def summary(self):
+        """A table of time, tokens, bytes and cache hits by kind and name."""
+        rows = {}
+        with self.lock:
+            spans = [span for span in self.spans if span is not self.root]
+        for span in spans:
+            row = rows.setdefault(
+                (span.kind, span.name), {"calls": 0, "total": 0.0, "max": 0.0, "errors": 0}
+            )
+            row["calls"] += 1
+            row["total"] += span.seconds
+            row["max"] = max(row["max"], span.seconds)
+            row["errors"] += span.status == "error"
+            for key in TOTALS:
+                value = span.attributes.get(key)
+                if isinstance(value, (int, float)):
+                    row[key] = row.get(key, 0) + value
+
+        total = self.root.seconds if self.root.seconds is not None else 0.0
+        table = Table(title=f"Turn {total:.2f}s", title_justify="left")
+        table.add_column("Kind")
+        table.add_column("Name")
+        for column in ["Calls", "Total ms", "Max ms", "Tokens in/out", "Bytes", "Cache hits"]:
+            table.add_column(column, justify="right")
+        for (kind, name), row in sorted(rows.items(), key=lambda item: -item[1]["total"]):
+            tokens = "-"
+            if "input_tokens" in row or "output_tokens" in row:
+                tokens = f"{row.get('input_tokens', 0)}/{row.get('output_tokens', 0)}"
+            lookups = row.get("cache_hits", 0) + row.get("cache_misses", 0)
+            table.add_row(
+                kind,
+                name,
+                f"{row['calls']}" + (f" ({row['errors']} failed)" if row["errors"] else ""),
+                f"{row['total'] * 1000:.0f}",
+                f"{row['max'] * 1000:.0f}",
+                tokens,
+                f"{row['bytes']:,}" if "bytes" in row else "-",
+                f"{row.get('cache_hits', 0)}/{lookups}" if lookups else "-",
+            )
+        return table
+
+    def export(self, path):
+        with self.lock:
+            lines = [json.dumps(span.to_dict(), default=str) for span in self.spans]
+        with export_lock, open(path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+@contextmanager
+def trace_turn(name, **attributes):
+    """
+    Trace a turn when tracing is configured, yielding the Trace or None. The
+    spans are exported when the turn ends.
+    """
+    if export_path is None:
+        yield None
+        return
+    trace = Trace(name, **attributes)
+    trace_token = current_trace.set(trace)
+    span_token = current_span.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.fail(e)
+        raise
+    finally:
+        current_span.reset(span_token)
+        current_trace.reset(trace_token)
+        trace.root.finish()
+        trace.export(export_path)
+
+
+@contextmanager
+def span(name, kind="internal", **attributes):
+    """A span under the current one, a no-op outside a traced turn."""
+    trace = current_trace.get()
+    if trace is None:
+        yield noop_span
+        return
+    span = Span(trace, name, kind, current_span.get(), attributes)
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.fail(e)
+        raise
+    finally:
+        current_span.reset(token)
+        span.finish()
+
+
+def bind(fn):
+    """`fn` for running on a pool thread, its spans land in the caller's trace."""
+    trace, parent = current_trace.get(), current_span.get()
+    if trace is None:
+        return fn
+
+    def run(*args, **kwargs):
+        trace_token = current_trace.set(trace)
+        span_token = current_span.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            current_span.reset(span_token)
+            current_trace.reset(trace_token)
+
+    return run
+
+
+class TraceHandler(BaseCallbackHandler):
+    """Spans for the LLM calls, tool calls and retrievals of a traced run."""
+
+    # called on the event loop rather than a worker thread, cheap enough
+    run_inline = True
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.spans = {}
+
+    def start(self, run_id, name, kind, **attributes):
+        self.spans[run_id] = Span(self.trace, name, kind, self.trace.root, attributes)
+
+    def end(self, run_id, error=None, **attributes):
+        span = self.spans.pop(run_id, None)
+        if span is None:
+            return
+        span.set(**attributes)
+        if error is not None:
+            span.fail(error)
+        span.finish()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        name = (kwargs.get("metadata") or {}).get("ls_model_name") or (
+            serialized or {}
+        ).get("name", "llm")
+        self.start(run_id, name, "llm", messages=sum(len(batch) for batch in messages))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or usage
+        if not usage:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+        self.end(
+            run_id,
+            input_tokens=usage.get("input_tokens", usage.get("prompt_tokens")),
+            output_tokens=usage.get("output_tokens", usage.get("completion_tokens")),
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.start(run_id, (serialized or {}).get("name", "tool"), "tool")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        content = getattr(output, "content", output)
+        self.end(run_id, bytes=len(str(content).encode("utf-8")))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self.end(run_id, error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self.start(run_id, kwargs.get("name") or "retriever", "search")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self.end(run_id, documents=len(documents))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self.end(run_id, error)
@@ -0,0 +1,303 @@
+import json
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from lib.etherscan import iter_row_batches
+from lib.constants import TXSTORE_PATH, INGEST_BATCH_SIZE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    address TEXT NOT NULL,
+    filter TEXT NOT NULL,
+    row_key TEXT NOT NULL,
+    hash TEXT,
+    block_number INTEGER,
+    timestamp INTEGER,
+    from_address TEXT,
+    to_address TEXT,
+    contract_address TEXT,
+    token_symbol TEXT,
+    token_name TEXT,
+    token_id TEXT,
+    amount REAL,
+    fee_eth REAL,
+    is_error INTEGER,
+    raw TEXT NOT NULL,
+    PRIMARY KEY (address, filter, row_key)
+);
+CREATE INDEX IF NOT EXISTS transactions_block
+    ON transactions (address, filter, block_number);
+CREATE INDEX IF NOT EXISTS transactions_time
+    ON transactions (address, filter, timestamp);
+"""
+
+COLUMNS = [
+    "address",
+    "filter",
+    "row_key",
+    "hash",
+    "block_number",
+    "timestamp",
+    "from_address",
+    "to_address",
+    "contract_address",
+    "token_symbol",
+    "token_name",
+    "token_id",
+    "amount",
+    "fee_eth",
+    "is_error",
+    "raw",
+]
+
+local = threading.local()
+synced = set()
+sync_locks = {}
+sync_locks_lock = threading.Lock()
+
+
+def get_connection():
+    """One SQLite connection per thread, the schema is created on first use."""
+    if getattr(local, "connection", None) is None:
+        connection = sqlite3.connect(TXSTORE_PATH, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        local.connection = connection
+    return local.connection
+
+
+def get_amount(filter, item):
+    if filter in ("normal_transaction", "internal_transaction"):
+        return int(item.get("value") or 0) / 10**18
+    if filter == "erc20_transaction":
+        return int(item.get("value") or 0) / 10 ** int(item.get("tokenDecimal") or 0)
+    if filter == "erc1155_transaction":
+        return float(item.get("tokenValue") or 0)
+    return 1.0
+
+
+def to_record(address, filter, item):
+    raw = json.dumps(item)
+    fee = None
+    # only the sender of a normal transaction pays gas for it
+    if filter == "normal_transaction" and item["from"].lower() == address:
+        fee = int(item.get("gasUsed") or 0) * int(item.get("gasPrice") or 0) / 10**18
+    return (
+        address,
+        filter,
+        hashlib.sha256(raw.encode("utf-8")).hexdigest(),
+        item.get("hash"),
+        int(item["blockNumber"]),
+        int(item["timeStamp"]),
+        item.get("from", "").lower(),
+        item.get("to", "").lower(),
+        item.get("contractAddress", "").lower() or None,
+        item.get("tokenSymbol"),
+        item.get("tokenName"),
+        item.get("tokenID"),
+        get_amount(filter, item),
+        fee,
+        int(item.get("isError") or 0),
+        raw,
+    )
+
+
+def insert_rows(address, filter, rows):
+    address = address.lower()
+    connection = get_connection()
+    with connection:
+        cursor = connection.executemany(
+            f"INSERT OR IGNORE INTO transactions ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(COLUMNS))})",
+            [to_record(address, filter, item) for item in rows],
+        )
+    return cursor.rowcount
+
+
+def get_last_block(address, filter):
+    row = get_connection().execute(
+        "SELECT MAX(block_number) FROM transactions "
+        "WHERE address = ? AND filter = ?",
+        (address.lower(), filter),
+    )
+    return row.fetchone()[0]
+
+
+def get_version(address):
+    """Changes whenever rows are stored for `address`."""
+    count, last_block = (
+        get_connection()
+        .execute(
+            "SELECT COUNT(*), MAX(block_number) FROM transactions WHERE address = ?",
+            (address.lower(),),
+        )
+        .fetchone()
+    )
+    return f"{count}:{last_block}"
+
+
+def count_transactions(address):
+    return (
+        get_connection()
+        .execute("SELECT COUNT(*) FROM transactions WHERE address = ?", (address.lower(),))
+        .fetchone()[0]
+    )
+
+
+def iter_stored_batches(
+    address, filter, start_block=None, batch_size=INGEST_BATCH_SIZE
+):
+    """Stored raw rows from `start_block` on, in block order and bounded batches."""
+    cursor = get_connection().execute(
+        "SELECT raw FROM transactions WHERE address = ? AND filter = ? "
+        "AND block_number >= ? ORDER BY block_number",
+        (address.lower(), filter, start_block or 0),
+    )
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield [json.loads(row["raw"]) for row in rows]
+
+
+def get_sync_lock(address, filter):
+    with sync_locks_lock:
+        return sync_locks.setdefault((address.lower(), filter), threading.Lock())
+
+
+def sync_transactions(filter, address):
+    """
+    Pull rows newer than the last stored block from Etherscan into the store,
+    yielding each inserted batch so callers can index it as it arrives.
+
+    One sync runs per address and filter at a time. A caller arriving while
+    one is running (the wallet index and the aggregate tools, or two requests
+    about the same wallet) waits for it and yields nothing; the rows are in
+    the store when it returns.
+    """
+    lock = get_sync_lock(address, filter)
+    if not lock.acquire(blocking=False):
+        with lock:
+            return
+    try:
+        last_block = get_last_block(address, filter)
+        for batch in iter_row_batches(filter, address, last_block):
+            insert_rows(address, filter, batch)
+            yield batch
+        synced.add((address.lower(), filter))
+    finally:
+        lock.release()
+
+
+def ensure_synced(filter, address):
+    """Sync `filter` once per process, later calls read the store as is."""
+    if (address.lower(), filter) not in synced:
+        for _ in sync_transactions(filter, address):
+            pass
+
+
+def to_timestamp(date):
+    return int(
+        datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+    )
+
+
+GROUPS = {
+    "none": "'all'",
+    "token": "COALESCE(token_symbol, 'ETH')",
+    "counterparty": (
+        "CASE WHEN from_address = :address THEN to_address ELSE from_address END"
+    ),
+    "day": "strftime('%Y-%m-%d', timestamp, 'unixepoch')",
+    "month": "strftime('%Y-%m', timestamp, 'unixepoch')",
+    "year": "strftime('%Y', timestamp, 'unixepoch')",
+}
+
+
+def build_where(
+    address,
+    filter,
+    direction="all",
+    token=None,
+    counterparty=None,
+    start_date=None,
+    end_date=None,
+):
+    clauses = ["address = :address", "filter = :filter"]
+    params = {"address": address.lower(), "filter": filter}
+    if direction == "in":
+        clauses.append("to_address = :address")
+    elif direction == "out":
+        clauses.append("from_address = :address")
+    if token:
+        # ETH rows have no symbol, GROUPS labels them 'ETH' the same way
+        clauses.append(
+            "(UPPER(COALESCE(token_symbol, 'ETH')) = UPPER(:token) "
+            "OR contract_address = LOWER(:token))"
+        )
+        params["token"] = token
+    if counterparty:
+        clauses.append("(from_address = :counterparty OR to_address = :counterparty)")
+        params["counterparty"] = counterparty.lower()
+    if start_date:
+        clauses.append("timestamp >= :start")
+        params["start"] = to_timestamp(start_date)
+    if end_date:
+        # end date is inclusive
+        clauses.append("timestamp < :end")
+        params["end"] = to_timestamp(end_date) + 86400
+    return " AND ".join(clauses), params
+
+
+def aggregate(address, filter, group_by="none", limit=20, **filters):
+    """
+    Count, amount in/out and gas fees per group. Failed transactions only count
+    towards fees. Time groups come in date order, other groups largest net flow
+    first.
+    """
+    where, params = build_where(address, filter, **filters)
+    params["limit"] = limit
+    if group_by in ("day", "month", "year"):
+        order = "grp"
+    else:
+        order = "ABS(amount_in - amount_out) DESC, count DESC"
+    query = f"""
+        SELECT {GROUPS[group_by]} AS grp,
+               COUNT(*) AS count,
+               SUM(CASE WHEN to_address = :address AND NOT is_error
+                   THEN amount ELSE 0 END) AS amount_in,
+               SUM(CASE WHEN from_address = :address AND NOT is_error
+                   THEN amount ELSE 0 END) AS amount_out,
+               SUM(COALESCE(fee_eth, 0)) AS fee_eth
+        FROM transactions WHERE {where}
+        GROUP BY grp ORDER BY {order}
+        LIMIT :limit
+    """
+    return [dict(row) for row in get_connection().execute(query, params)]
+
+
+def list_transactions(address, filter, limit=20, **filters):
+    """Matching rows, newest first."""
+    where, params = build_where(address, filter, **filters)
+    params["limit"] = limit
+    query = f"""
+        SELECT hash, block_number,
+               datetime(timestamp, 'unixepoch') AS time,
+               from_address, to_address, token_symbol, token_id, amount, fee_eth, is_error
+        FROM transactions WHERE {where}
+        ORDER BY block_number DESC LIMIT :limit
+    """
+    return [dict(row) for row in get_connection().execute(query, params)]
+
+
+def get_tokens(address):
+    """ERC-20 contracts in the address's history with their symbols."""
+    query = """
+        SELECT contract_address, MAX(token_symbol) AS token_symbol
+        FROM transactions WHERE address = ? AND filter = 'erc20_transaction'
+        GROUP BY contract_address ORDER BY COUNT(*) DESC
+    """
+    return [dict(row) for row in get_connection().execute(query, (address.lower(),))]
@@ -1,5 +1,6 @@
 import os
 import re
+import json
 import random
 from datetime import datetime
 from colorama import Fore, Style
@@ -11,25 +12,18 @@ from dotenv import load_dotenv
 
 
 from rich.console import Console
+from rich.live import Live
 from rich.panel import Panel
 from rich.text import Text
 
-from langchain_community.vectorstores import Chroma
-from langchain_community.document_loaders import EtherscanLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders.merge import MergedDataLoader
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_community.document_loaders import PyPDFLoader
-
-from lib.llm import embeddings
-from lib.constants import ETHERSCAN_OFFSET, VECTORSTORE_DIR, WHITEPAPER_URL
 
 load_dotenv()
 console = Console(force_terminal=True)
 
 
-def validate_args():
-    if os.getenv("ACCOUNT_ADDRESS") is None:
+def validate_args(require_address=True):
+    if require_address and os.getenv("ACCOUNT_ADDRESS") is None:
         log_error(
             "Please set the ACCOUNT_ADDRESS environment variable to your Ethereum account address."
         )
@@ -41,42 +35,8 @@ def validate_args():
         exit(1)
 
 
-def get_loader(filter):
-    spinner = Halo(
-        text=f"Load Etherscan {filter} History",
-        spinner="dots",
-    )
-    spinner.start()
-
-    loader = EtherscanLoader(
-        os.getenv("ACCOUNT_ADDRESS"),
-        filter=filter,
-        offset=ETHERSCAN_OFFSET,
-        sort="desc",
-    )
-
-    spinner.succeed(f"Loaded {set_color(filter, 'blue')} history from Etherscan.")
-
-    return loader
-
-
-def get_etherscan_docs(filter):
-    validate_args()
-
-    loader = get_loader(filter)
-    result = loader.load()
-
-    return result
-
-
-def get_whitepaper_docs():
-    loader = PyPDFLoader(WHITEPAPER_URL)
-    result = loader.load()
-    return result
-
-
-def split_docs(docs, chunk_size=100, chunk_overlap=50):
-    spinner = Halo(text="Splitting documents", spinner="dots")
+def split_docs(docs, chunk_size=100, chunk_overlap=50, quiet=False):
+    spinner = Halo(text="Splitting documents", spinner="dots", enabled=not quiet)
     spinner.start()
 
     text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
@@ -88,25 +48,6 @@ def split_docs(docs, chunk_size=100, chunk_overlap=50):
     return doc_splits
 
 
-def get_retriever(docs, name):
-    # docs = split_docs(docs)
-
-    spinner = Halo(text=f"Creating {name} vectorstore", spinner="dots")
-    spinner.start()
-
-    vectorstore = Chroma.from_documents(
-        documents=docs,
-        collection_name=f"{VECTORSTORE_DIR}_{name}",
-        embedding=embeddings,
-    )
-    retriever = vectorstore.as_retriever()
-
-    spinner.succeed(
-        f"Created {set_color(name, 'green')} vector store with {len(docs)} chunks."
-    )
-    return retriever
-
-
 def set_color(text: str, color: str):
     color_map = {
         "blue": Fore.BLUE,
@@ -119,6 +60,25 @@ def set_color(text: str, color: str):
     return f"{color_map.get(color, Fore.RESET)}{text}{Style.RESET_ALL}"
 
 
+def get_agent_panel(message, content=None):
+    """The panel an agent message is shown in, `content` overrides while streaming."""
+    metadata = getattr(message, "response_metadata", {}) or {}
+    model = metadata.get("model", metadata.get("model_name", "Unknown Model Name"))
+    created_at = format_timestamp(
+        metadata.get("created_at", datetime.now().isoformat())
+    )
+    return Panel(
+        Text(
+            f"\n{content if content is not None else message.content}\n\n"
+            f"{set_color('Model:', 'blue')} {model}\n"
+            f"{set_color('Timestamp:', 'blue')} {created_at}",
+            style="white",
+        ),
+        title="Agent Message",
+        border_style="cyan",
+    )
+
+
 def log_step(step, spinner):
     """Display a step dynamically based on its type."""
     if isinstance(step, dict):
@@ -129,28 +89,10 @@ def log_step(step, spinner):
                     if message.content is None:
                         continue
                     content = message.content or "[No content]"
-                    metadata = getattr(message, "response_metadata", {})
-                    model = metadata.get(
-                        "model", metadata.get("model_name", "Unknown Model Name")
-                    )
-                    created_at = format_timestamp(
-                        metadata.get("created_at", datetime.now().isoformat())
-                    )
 
                     if content != "[No content]":
                         spinner.stop()
-                        console.print(
-                            Panel(
-                                Text(
-                                    f"\n{content}\n\n"
-                                    f"{set_color('Model:', 'blue')} {model}\n"
-                                    f"{set_color('Timestamp:', 'blue')} {created_at}",
-                                    style="white",
-                                ),
-                                title="Agent Message",
-                                border_style="cyan",
-                            )
-                        )
+                        console.print(get_agent_panel(message))
         elif "tools" in step:
             tool_messages = step["tools"].get("messages", [])
             for tool_message in tool_messages:
@@ -170,6 +112,9 @@ def log_step(step, spinner):
                     )
                 )
                 spinner.start()
+        elif "pre_model_hook" in step:
+            # history compaction, nothing to show
+            pass
         else:
             spinner.stop()
             console.print(
@@ -192,6 +137,69 @@ def log_step(step, spinner):
         spinner.start()
 
 
+class StreamRenderer:
+    """
+    Renders a run streamed with stream_mode=["messages", "updates"]: agent
+    tokens go into a live panel as they arrive, tool calls are announced when
+    the model makes them and their outputs shown when they return. A finished
+    message ends up in the same panel `log_step` prints.
+    """
+
+    def __init__(self, spinner):
+        self.spinner = spinner
+        self.live = None
+        self.text = ""
+
+    def on_token(self, chunk, metadata):
+        # only the agent node's tokens, not e.g. compaction summaries
+        if metadata.get("langgraph_node") != "agent":
+            return
+        if not isinstance(chunk.content, str) or not chunk.content:
+            return
+        self.text += chunk.content
+        if self.live is None:
+            self.spinner.stop()
+            self.live = Live(console=console, refresh_per_second=12)
+            self.live.start()
+        self.live.update(get_agent_panel(chunk, self.text))
+
+    def on_update(self, step):
+        if "agent" not in step:
+            self.spinner.text = "Thinking..."
+            log_step(step, self.spinner)
+            return
+
+        for message in step["agent"].get("messages", []):
+            if self.live is not None:
+                self.live.update(get_agent_panel(message))
+                self.close()
+            elif message.content:
+                log_step({"agent": {"messages": [message]}}, self.spinner)
+
+            calls = getattr(message, "tool_calls", None) or []
+            for call in calls:
+                console.print(
+                    Text.assemble(
+                        ("Tool Call: ", "magenta"),
+                        f"{call['name']} {json.dumps(call['args'], default=str)}",
+                    )
+                )
+            if calls:
+                self.spinner.text = "Running tools..."
+                self.spinner.start()
+
+    def close(self):
+        if self.live is not None:
+            self.live.stop()
+            self.live = None
+        self.text = ""
+
+    def on_trace(self, trace):
+        self.close()
+        self.spinner.stop()
+        console.print(trace.summary())
+
+
 def format_timestamp(timestamp):
     try:
         dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
@@ -0,0 +1,143 @@
+import time
+import threading
+
+from rich.table import Table
+
+from lib import txstore
+from lib.client import client
+from lib.etherscan import ETHERSCAN_HOST, get_block_number
+from lib.pipeline import get_open_wallet_index
+from lib.utils import console
+from lib.constants import (
+    BLOCK_WATCH_INTERVAL,
+    BLOCK_WATCH_MAX_INTERVAL,
+)
+
+# spare Etherscan calls a poll needs, the agent's own requests go first
+HEADROOM = 3
+
+
+class BlockWatcher:
+    """
+    Follows the chain head on a background thread and appends the wallets' new
+    transactions to the transaction store and their open wallet indexes, so
+    answers see transfers that land during the session.
+
+    Only filters already synced in the session are followed, the rest are
+    fetched in full on first use anyway, and only when the head has moved. The
+    poll interval starts at about a block, grows while nothing new turns up
+    and doubles on errors or throttling. A poll is skipped while the agent is
+    using Etherscan's rate limit.
+    """
+
+    def __init__(
+        self,
+        addresses,
+        filters,
+        interval=BLOCK_WATCH_INTERVAL,
+        max_interval=BLOCK_WATCH_MAX_INTERVAL,
+    ):
+        self.addresses = list(addresses)
+        # the balance is refreshed when transactions land rather than polled
+        self.filters = [filter for filter in filters if filter != "eth_balance"]
+        self.min_interval = interval
+        self.max_interval = max_interval
+        self.interval = interval
+        self.block = None
+        self.throttled = client.get_throttled(ETHERSCAN_HOST)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="block-watcher", daemon=True)
+        self.polls = 0
+        self.skipped = 0
+        self.new_rows = 0
+        self.last_new = None
+        self.errors = 0
+        self.last_error = None
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                found = self.poll()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                self.slow_down(2)
+                continue
+            if found is None:
+                continue
+            throttled = client.get_throttled(ETHERSCAN_HOST)
+            if throttled > self.throttled:
+                self.throttled = throttled
+                self.slow_down(2)
+            elif found:
+                self.interval = self.min_interval
+            else:
+                self.slow_down(1.5)
+
+    def slow_down(self, factor):
+        self.interval = min(self.max_interval, self.interval * factor)
+
+    def poll(self):
+        """
+        Check the head once. Returns whether new transactions were stored, or
+        None when the poll was skipped to leave the rate limit to the agent.
+        """
+        if not client.has_headroom(ETHERSCAN_HOST, HEADROOM):
+            self.skipped += 1
+            return None
+        self.polls += 1
+        block = get_block_number()
+        if self.block is not None and block <= self.block:
+            return False
+        self.block = block
+        found = False
+        for address in self.addresses:
+            added = self.catch_up(address)
+            if added:
+                self.new_rows += added
+                self.last_new = (address, block, time.time())
+                found = True
+        return found
+
+    def catch_up(self, address):
+        """Store and index the address's rows since the last stored block, returning how many."""
+        count = txstore.count_transactions(address)
+        index = get_open_wallet_index(address)
+        for filter in self.filters:
+            if self.stopped.is_set():
+                break
+            if (address.lower(), filter) not in txstore.synced:
+                continue
+            # starts at the last stored block, rows seen before are ignored
+            for batch in txstore.sync_transactions(filter, address):
+                if index is not None:
+                    index.append(filter, batch)
+        added = txstore.count_transactions(address) - count
+        if added and index is not None:
+            index.refresh_balance()
+        return added
+
+    def report(self):
+        table = Table(title="Block Watcher")
+        for column in ["Head", "Interval s", "Polls", "Skipped", "New rows", "Last new", "Errors"]:
+            table.add_column(column, justify="right")
+        last_new = "-"
+        if self.last_new:
+            address, block, at = self.last_new
+            last_new = f"{address[:10]} block {block}, {time.time() - at:.0f}s ago"
+        table.add_row(
+            str(self.block or "-"),
+            f"{self.interval:.0f}",
+            str(self.polls),
+            str(self.skipped),
+            str(self.new_rows),
+            last_new,
+            f"{self.errors} ({self.last_error})" if self.last_error else str(self.errors),
+        )
+        console.print(table)